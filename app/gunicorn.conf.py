@@ -0,0 +1,20 @@
+# Read by gunicorn from the directory it's started in
+import os
+import shutil
+
+
+def on_starting(server):
+    # Metrics files left by the previous run's workers would otherwise be added to
+    # this run's totals. The directory is only the workers': other processes, such as
+    # the mailer, keep their files elsewhere.
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from weddingwrangle import counters
 from weddingwrangle.models import (
     Title,
     Position,
@@ -9,11 +10,37 @@ from weddingwrangle.models import (
     Audience,
     Email,
     Guest,
+    QueuedEmail,
 )
 
 # Register your models here.
 
-admin.site.register(Guest)
+
+@admin.register(Guest)
+class GuestAdmin(admin.ModelAdmin):
+    search_fields = ["first_name", "surname", "email_address"]
+    autocomplete_fields = ["partner"]
+
+    # Keep the running totals in step with edits made here. Audiences are saved after
+    # the guest, so each step is counted on its own.
+    def save_model(self, request, obj, form, change):
+        with counters.track(obj):
+            super().save_model(request, obj, form, change)
+
+    def save_related(self, request, form, formsets, change):
+        with counters.track(form.instance):
+            super().save_related(request, form, formsets, change)
+
+    def delete_model(self, request, obj):
+        with counters.track(obj):
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        guests = list(queryset)
+        with counters.track(*guests):
+            super().delete_queryset(request, queryset)
+
+
 admin.site.register(Title)
 admin.site.register(Position)
 admin.site.register(RSVPStatus)
@@ -22,3 +49,4 @@ admin.site.register(Main)
 admin.site.register(Dietary)
 admin.site.register(Audience)
 admin.site.register(Email)
+admin.site.register(QueuedEmail)
@@ -0,0 +1,142 @@
+import hashlib
+from django.contrib.auth.decorators import login_required
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db.models import Max
+from django.http import JsonResponse
+from django.views.decorators.http import condition
+from weddingwrangle import caching
+from weddingwrangle.models import Guest, SummaryCounter
+
+API_VERSION = 1
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+def format_datetime(value):
+    return value.isoformat() if value is not None else None
+
+
+def format_name(value):
+    return value.name if value is not None else None
+
+
+# Each field maps to a function which pulls its JSON value out of a guest. Fields
+# which need a join or a prefetch say so, so that unrequested relations aren't loaded
+GUEST_FIELDS = {
+    "id": (lambda guest: guest.pk, None),
+    "title": (lambda guest: format_name(guest.title), "title"),
+    "first_name": (lambda guest: guest.first_name, None),
+    "surname": (lambda guest: guest.surname, None),
+    "email_address": (lambda guest: guest.email_address, None),
+    "position": (lambda guest: format_name(guest.position), "position"),
+    "rsvp_status": (lambda guest: format_name(guest.rsvp_status), "rsvp_status"),
+    "rsvp_at": (lambda guest: format_datetime(guest.rsvp_at), None),
+    "partner": (lambda guest: guest.partner_id, None),
+    "starter": (lambda guest: format_name(guest.starter), "starter"),
+    "main": (lambda guest: format_name(guest.main), "main"),
+    "dietaries": (
+        lambda guest: [dietary.name for dietary in guest.dietaries.all()],
+        "dietaries",
+    ),
+    "dietary_other": (lambda guest: guest.dietary_other, None),
+    "created_at": (lambda guest: format_datetime(guest.created_at), None),
+    "updated_at": (lambda guest: format_datetime(guest.updated_at), None),
+}
+
+
+def guest_list_state(request):
+    """Load the number of guests and the most recent change to any of them. This is
+    cached on the request because the ETag and Last-Modified checks both need it.
+    The number is the running total rather than a count, which would read every
+    entry of an index, leaving MAX(updated_at) to be looked up at the end of one."""
+    if not hasattr(request, "_guest_list_state"):
+        request._guest_list_state = {
+            "count": SummaryCounter.objects.read(SummaryCounter.GUESTS)[
+                SummaryCounter.GUESTS
+            ],
+            **Guest.objects.aggregate(updated_at=Max("updated_at")),
+        }
+    return request._guest_list_state
+
+
+def guest_list_etag(request):
+    state = guest_list_state(request)
+    # The query string is part of the ETag because each page and field selection is a
+    # different representation of the same guest list. Guests are shown with the
+    # names of their title, RSVP status, dietaries and so on, so renaming any of
+    # those changes the representation too.
+    fingerprint = "{}:{}:{}:{}:{}".format(
+        API_VERSION,
+        state["count"],
+        format_datetime(state["updated_at"]),
+        caching.get_reference_version(),
+        request.GET.urlencode(),
+    )
+    return hashlib.md5(fingerprint.encode("utf-8")).hexdigest()
+
+
+def guest_list_last_modified(request):
+    return guest_list_state(request)["updated_at"]
+
+
+def parse_fields(request):
+    """Return the requested fields, in order, or raise ValueError if any are unknown"""
+    requested = request.GET.get("fields")
+    if not requested:
+        return list(GUEST_FIELDS)
+    fields = [field.strip() for field in requested.split(",") if field.strip()]
+    unknown = [field for field in fields if field not in GUEST_FIELDS]
+    if unknown:
+        raise ValueError("Unknown fields: " + ", ".join(unknown))
+    return fields
+
+
+def parse_page_size(request):
+    try:
+        page_size = int(request.GET.get("page_size", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError("page_size must be a whole number")
+    if page_size < 1:
+        raise ValueError("page_size must be at least 1")
+    return min(page_size, MAX_PAGE_SIZE)
+
+
+@login_required
+@condition(etag_func=guest_list_etag, last_modified_func=guest_list_last_modified)
+def guest_list(request):
+    """Returns a page of the guestlist as JSON. Unchanged polls are answered with a
+    304 by the condition decorator before anything here runs"""
+    try:
+        fields = parse_fields(request)
+        page_size = parse_page_size(request)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    queryset = Guest.objects.with_related().order_by("pk")
+    relations = {GUEST_FIELDS[field][1] for field in fields}
+    if "dietaries" not in relations:
+        # Skip the prefetch query entirely if dietaries weren't asked for
+        queryset = queryset.prefetch_related(None)
+
+    paginator = Paginator(queryset, page_size)
+    # The count is already known from the conditional GET check
+    paginator.count = guest_list_state(request)["count"]
+    try:
+        page = paginator.page(request.GET.get("page", 1))
+    except (EmptyPage, PageNotAnInteger) as e:
+        return JsonResponse({"error": str(e)}, status=404)
+
+    return JsonResponse(
+        {
+            "version": API_VERSION,
+            "count": paginator.count,
+            "page": page.number,
+            "num_pages": paginator.num_pages,
+            "next": page.next_page_number() if page.has_next() else None,
+            "previous": page.previous_page_number() if page.has_previous() else None,
+            "results": [
+                {field: GUEST_FIELDS[field][0](guest) for field in fields}
+                for guest in page.object_list
+            ],
+        }
+    )
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class WeddingwrangleConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'weddingwrangle'
+
+    def ready(self):
+        # Connect the signal receivers which keep the app's caches fresh
+        from weddingwrangle import signals  # noqa: F401
@@ -0,0 +1,124 @@
+"""Async versions of the public RSVP views, for running under an ASGI server.
+
+The guest lookup and the page cache are awaited directly, so a worker can serve
+other guests while they're in progress. Form validation, saving and template
+rendering still use the sync ORM (e.g. for choices and dietaries), so they are
+handed to a thread with sync_to_async.
+
+The organisers' live RSVP stream is here too, since it spends nearly all its time
+waiting for the next event.
+"""
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, HttpResponseRedirect
+from django.shortcuts import render
+from django.urls import reverse
+from django.views import View
+from weddingwrangle import caching, events
+from weddingwrangle.forms import RSVPForm
+from weddingwrangle.models import Guest
+from weddingwrangle.views import (
+    RSVPLinkMixin,
+    event_stream_response,
+    queue_rsvp_confirmation,
+)
+
+
+class AsyncRSVPPageMixin:
+    """Looks up the guest for the RSVP link and caches GET responses, as
+    RSVPLinkMixin and GuestPageCacheMixin do for the sync views"""
+
+    queryset = RSVPLinkMixin.queryset
+    template_name = None
+
+    async def get_object(self):
+        try:
+            return await self.queryset.aget(rsvp_link=self.kwargs["rsvp_link"])
+        except Guest.DoesNotExist:
+            raise Http404("No guest found with this RSVP link")
+
+    async def render(self, request, context):
+        return await sync_to_async(render)(request, self.template_name, context)
+
+    async def get(self, request, *args, **kwargs):
+        key = await sync_to_async(caching.get_guest_page_key)(
+            request, self.kwargs["rsvp_link"]
+        )
+        if key is not None:
+            content = await cache.aget(key)
+            if content is not None:
+                return HttpResponse(content)
+        response = await self.render_page(request, await self.get_object())
+        if key is not None:
+            await cache.aset(key, response.content, settings.PAGE_CACHE_SECONDS)
+        return response
+
+
+class AsyncRSVPFormMixin(AsyncRSVPPageMixin):
+    form_class = RSVPForm
+    # Whether to queue the RSVP template email once the form is saved
+    send_confirmation = False
+    # The name of the URL to redirect to once the form is saved, and whether it takes
+    # the guest's RSVP link
+    success_url_name = None
+    success_url_with_link = False
+
+    def get_success_url(self, guest):
+        args = [guest.rsvp_link] if self.success_url_with_link else []
+        return reverse(self.success_url_name, args=args)
+
+    async def render_page(self, request, guest, form=None):
+        if form is None:
+            form = await sync_to_async(self.form_class)(instance=guest)
+        return await self.render(
+            request, {"form": form, "guest": guest, "object": guest}
+        )
+
+    def save(self, form):
+        """Validate and save the form, returning whether it was valid"""
+        if not form.is_valid():
+            return False
+        guest = form.save()
+        if self.send_confirmation:
+            queue_rsvp_confirmation(guest, form.cleaned_data["dietaries"])
+        return True
+
+    async def post(self, request, *args, **kwargs):
+        guest = await self.get_object()
+        form = await sync_to_async(self.form_class)(request.POST, instance=guest)
+        if await sync_to_async(self.save)(form):
+            return HttpResponseRedirect(self.get_success_url(guest))
+        return await self.render_page(request, guest, form)
+
+
+class AsyncRSVPView(AsyncRSVPFormMixin, View):
+    template_name = "weddingwrangle/rsvp.html"
+    send_confirmation = True
+    success_url_name = "rsvp_thank"
+    success_url_with_link = True
+
+
+class AsyncRSVPPartner(AsyncRSVPFormMixin, View):
+    template_name = "weddingwrangle/rsvp_partner.html"
+    success_url_name = "rsvp_thank_partner"
+
+
+class AsyncRSVPThank(AsyncRSVPPageMixin, View):
+    template_name = "weddingwrangle/rsvp_thanks.html"
+
+    async def render_page(self, request, guest):
+        return await self.render(request, {"guest": guest, "object": guest})
+
+
+async def async_rsvp_events(request):
+    """Streams RSVP changes to the home page chart and the guest list without holding
+    a worker between events"""
+    # login_required can't wrap async views, and loading the user touches the session
+    if not await sync_to_async(lambda: request.user.is_authenticated)():
+        return redirect_to_login(request.get_full_path())
+    return event_stream_response(
+        events.astream_events(request.headers.get("Last-Event-ID"))
+    )
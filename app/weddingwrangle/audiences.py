@@ -0,0 +1,189 @@
+"""Keeps guests' audience memberships in line with the rules defined on each audience.
+
+An audience's positions and RSVP statuses are its rules: a guest belongs to it if
+their position and RSVP status are among them. Leaving either empty means any value
+is accepted. Audiences without any rules are managed by hand and never touched here,
+and virtual audiences are never stored at all: see Audience.members().
+"""
+
+from typing import NamedTuple
+from django.db import connection, models, transaction
+from django.db.models import F, Q, Value
+from django.utils import timezone
+from weddingwrangle import caching, counters
+from weddingwrangle.models import Audience, Guest
+
+GuestAudience = Guest.audiences.through
+
+
+class AudienceRule(NamedTuple):
+    audience_id: int
+    position_ids: frozenset
+    rsvp_status_ids: frozenset
+
+    def matches(self, guest):
+        return (not self.position_ids or guest.position_id in self.position_ids) and (
+            not self.rsvp_status_ids or guest.rsvp_status_id in self.rsvp_status_ids
+        )
+
+    def as_q(self):
+        """Return the rule as a filter on guests, for set-based updates"""
+        q = Q()
+        if self.position_ids:
+            q &= Q(position_id__in=self.position_ids)
+        if self.rsvp_status_ids:
+            q &= Q(rsvp_status_id__in=self.rsvp_status_ids)
+        return q
+
+
+def compile_rules():
+    rules = []
+    audiences = Audience.objects.filter(virtual=False).prefetch_related(
+        "positions", "rsvp_statuses"
+    )
+    for audience in audiences:
+        position_ids = frozenset(position.pk for position in audience.positions.all())
+        rsvp_status_ids = frozenset(
+            rsvp_status.pk for rsvp_status in audience.rsvp_statuses.all()
+        )
+        if position_ids or rsvp_status_ids:
+            rules.append(AudienceRule(audience.pk, position_ids, rsvp_status_ids))
+    return rules
+
+
+def get_rules():
+    """Return the compiled rules, which are cached alongside the reference data"""
+    return caching.get_reference_data("audience_rules", compile_rules)
+
+
+def target_audience_ids(guest, rules=None):
+    """Return the ids of the rule-based audiences which the guest should belong to"""
+    if rules is None:
+        rules = get_rules()
+    return {rule.audience_id for rule in rules if rule.matches(guest)}
+
+
+def sync_guest(guest):
+    """Bring a saved guest's rule-based audiences up to date, writing only the
+    memberships which have changed. Returns the ids added and removed."""
+    rules = get_rules()
+    if not rules:
+        return set(), set()
+    target = target_audience_ids(guest, rules)
+    current = set(
+        GuestAudience.objects.filter(
+            guest_id=guest.pk,
+            audience_id__in=[rule.audience_id for rule in rules],
+        ).values_list("audience_id", flat=True)
+    )
+    added = target - current
+    removed = current - target
+    if added:
+        GuestAudience.objects.bulk_create(
+            [
+                GuestAudience(guest_id=guest.pk, audience_id=audience_id)
+                for audience_id in added
+            ]
+        )
+    if removed:
+        GuestAudience.objects.filter(
+            guest_id=guest.pk, audience_id__in=removed
+        ).delete()
+    return added, removed
+
+
+def resync_audience(rule, dry_run=False):
+    """Rebuild one rule-based audience with a DELETE of the members who no longer
+    match and an INSERT ... SELECT of the guests who should be added. Returns the
+    number of memberships added and removed."""
+    matching = Guest.objects.filter(rule.as_q())
+    missing = (
+        matching.exclude(audiences=rule.audience_id)
+        .annotate(audience_id=Value(rule.audience_id, models.BigIntegerField()))
+        .values_list("pk", "audience_id")
+    )
+    stale = GuestAudience.objects.filter(audience_id=rule.audience_id).exclude(
+        guest_id__in=matching.values("pk")
+    )
+    if dry_run:
+        return missing.count(), stale.count()
+
+    # The through table has no signals, so this is a single DELETE statement
+    removed, _ = stale.delete()
+    sql, params = missing.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO {} ({}, {}) {}".format(
+                GuestAudience._meta.db_table,
+                GuestAudience._meta.get_field("guest").column,
+                GuestAudience._meta.get_field("audience").column,
+                sql,
+            ),
+            params,
+        )
+        added = cursor.rowcount
+    return added, removed
+
+
+def repair_partners(dry_run=False):
+    """Make every partnership reciprocal with one bulk_update. A guest is only
+    repaired if they have no partner of their own and their partner isn't already
+    claimed by somebody else. Returns the repaired guests."""
+    # "guest" is the reverse side of the partner relationship, i.e. the guest who has
+    # chosen this guest as their partner
+    repairs = list(
+        Guest.objects.filter(partner__isnull=True, guest__isnull=False)
+        .exclude(guest__guest__isnull=False)
+        .annotate(chosen_by=F("guest__pk"), chosen_by_link=F("guest__rsvp_link"))
+        .only("pk", "first_name", "surname", "rsvp_link")
+    )
+    if dry_run or not repairs:
+        return repairs
+
+    now = timezone.now()
+    for guest in repairs:
+        guest.partner_id = guest.chosen_by
+        guest.updated_at = now
+    Guest.objects.bulk_update(repairs, ["partner", "updated_at"])
+    # bulk_update doesn't send signals, so refresh the affected guests' caches here
+    caching.invalidate_guests(
+        *[guest.rsvp_link for guest in repairs],
+        *[guest.chosen_by_link for guest in repairs],
+    )
+    return repairs
+
+
+def resync_all(dry_run=False):
+    """Rebuild every rule-based audience and repair partnerships in one transaction.
+    Returns a report of what was (or, for a dry run, would be) changed."""
+    names = dict(Audience.objects.values_list("pk", "name"))
+    report = {"audiences": [], "partners": []}
+    with transaction.atomic():
+        for rule in compile_rules():
+            added, removed = resync_audience(rule, dry_run=dry_run)
+            report["audiences"].append(
+                {
+                    "audience": names[rule.audience_id],
+                    "added": added,
+                    "removed": removed,
+                }
+            )
+        # Virtual audiences are worked out when they're needed, so any memberships
+        # stored from before an audience became virtual are dropped
+        for audience_id in Audience.objects.filter(virtual=True).values_list(
+            "pk", flat=True
+        ):
+            stale = GuestAudience.objects.filter(audience_id=audience_id)
+            removed = stale.count() if dry_run else stale.delete()[0]
+            report["audiences"].append(
+                {"audience": names[audience_id], "added": 0, "removed": removed}
+            )
+        for guest in repair_partners(dry_run=dry_run):
+            report["partners"].append(
+                {"guest": str(guest), "guest_id": guest.pk, "partner_id": guest.chosen_by}
+            )
+        if not dry_run:
+            # Memberships were rewritten in bulk, so count the audiences again (along
+            # with any guests created in bulk before resyncing)
+            counters.rebuild()
+    return report
@@ -0,0 +1,64 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db import DEFAULT_DB_ALIAS
+from weddingwrangle import caching
+
+# The permissions ModelBackend caches on a user object
+PERMISSION_CACHES = ("_user_perm_cache", "_group_perm_cache", "_perm_cache")
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend, but loading the user for each request, along with their
+    permissions, from the cache. Saving or deleting a user (which includes changing
+    their password), or changing their groups or permissions, drops them from the
+    cache (see signals.py).
+
+    The cache may be a file shared by every process, so the password hash is left
+    out. Sessions are checked against hashes of it, which are cached instead, and the
+    password itself is only loaded from the database if something asks for it."""
+
+    def get_user(self, user_id):
+        cached = caching.get_user(user_id, lambda: self.load_user(user_id))
+        if cached is None:
+            return None
+        fields = cached["fields"]
+        user = get_user_model().from_db(
+            DEFAULT_DB_ALIAS, list(fields), list(fields.values())
+        )
+        for name in PERMISSION_CACHES:
+            setattr(user, name, cached[name])
+        model = type(user)
+
+        # Once the password has been loaded or set, as when it's changed, the hashes
+        # are worked out from it as usual
+        def get_session_auth_hash():
+            if "password" in user.__dict__:
+                return model.get_session_auth_hash(user)
+            return cached["session_auth_hash"]
+
+        def get_session_auth_fallback_hash():
+            if "password" in user.__dict__:
+                return model.get_session_auth_fallback_hash(user)
+            return iter(cached["session_auth_fallback_hashes"])
+
+        user.get_session_auth_hash = get_session_auth_hash
+        user.get_session_auth_fallback_hash = get_session_auth_fallback_hash
+        return user
+
+    def load_user(self, user_id):
+        user = super().get_user(user_id)
+        if user is None:
+            return None
+        self.get_all_permissions(user)
+        return {
+            "fields": {
+                field.attname: getattr(user, field.attname)
+                for field in user._meta.concrete_fields
+                if field.attname != "password"
+            },
+            "session_auth_hash": user.get_session_auth_hash(),
+            "session_auth_fallback_hashes": list(
+                user.get_session_auth_fallback_hash()
+            ),
+            **{name: getattr(user, name) for name in PERMISSION_CACHES},
+        }
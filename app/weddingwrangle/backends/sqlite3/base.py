@@ -0,0 +1,34 @@
+"""SQLite backend for several gunicorn workers sharing one database file.
+
+Two extra OPTIONS are understood, and are removed before the rest are passed on to
+sqlite3.connect():
+
+* "init_command": semicolon-separated statements, such as PRAGMAs, run on every new
+  connection
+* "transaction_mode": how transactions are begun, e.g. "IMMEDIATE". Write
+  transactions then take the write lock up front and wait their turn for it, rather
+  than failing with "database is locked" when upgrading a read lock part way through.
+"""
+
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        self.init_command = kwargs.pop("init_command", "")
+        self.transaction_mode = kwargs.pop("transaction_mode", None)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for statement in self.init_command.split(";"):
+            if statement.strip():
+                conn.execute(statement)
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode is None:
+            super()._start_transaction_under_autocommit()
+        else:
+            self.cursor().execute(f"BEGIN {self.transaction_mode}")
@@ -0,0 +1,248 @@
+"""Cache backend sharing one SQLite file between every process on a machine.
+
+Unlike the default local memory cache, entries are seen by every gunicorn worker and
+survive restarts, without running a cache server. The file uses WAL journaling, so
+reads carry on while another process writes.
+
+Besides Django's MAX_ENTRIES and CULL_FREQUENCY, two OPTIONS are understood:
+
+* "MAX_SIZE": the most bytes of pickled values to hold
+* "TABLE": the table to keep entries in, so that several caches can share a file
+
+Once either limit is passed, expired entries are removed, followed if need be by
+the least recently used. The number of entries and their total size are kept in a
+one-row table, updated by triggers in the same transaction as every write, so that
+checking the limits doesn't count the whole table each time. Recording every read
+would turn each one into a write, so an entry's last use is only updated once
+ACCESS_GRANULARITY seconds have passed.
+"""
+
+import os
+import pickle
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# How stale an entry's last use may be before a read updates it, in seconds
+ACCESS_GRANULARITY = 60
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._path = location
+        self._max_size = int(options.get("MAX_SIZE", 64 * 1024 * 1024))
+        table = options.get("TABLE", "cache")
+        if not re.fullmatch(r"\w+", table):
+            raise ValueError(f"Invalid cache table name: {table!r}")
+        # Quoted, as names like "default" are SQL keywords
+        self._table = f'"{table}"'
+        self._index = f'"{table}_accessed"'
+        self._stats = f'"{table}_stats"'
+        self._inserted_trigger = f'"{table}_inserted"'
+        self._deleted_trigger = f'"{table}_deleted"'
+        self._local = threading.local()
+
+    def _connection(self):
+        """Return this thread's connection, opening it (and creating the tables) the
+        first time. Connections aren't carried across a fork."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self._path, timeout=20, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            # So that the rows INSERT OR REPLACE overwrites fire the delete trigger
+            connection.execute("PRAGMA recursive_triggers=ON")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+            self._create_tables()
+        return connection
+
+    def _create_tables(self):
+        """Create the entries and stats tables and the triggers which keep the stats,
+        counting any entries already stored (by a version without the stats)"""
+        with self._transaction() as connection:
+            connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {self._table} ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL, "
+                "accessed REAL NOT NULL, size INTEGER NOT NULL)"
+            )
+            connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {self._index} "
+                f"ON {self._table} (accessed)"
+            )
+            connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {self._stats} ("
+                "id INTEGER PRIMARY KEY CHECK (id = 0), "
+                "count INTEGER NOT NULL, size INTEGER NOT NULL)"
+            )
+            connection.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {self._inserted_trigger} "
+                f"AFTER INSERT ON {self._table} BEGIN "
+                f"UPDATE {self._stats} SET count = count + 1, size = size + NEW.size "
+                "WHERE id = 0; END"
+            )
+            connection.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {self._deleted_trigger} "
+                f"AFTER DELETE ON {self._table} BEGIN "
+                f"UPDATE {self._stats} SET count = count - 1, size = size - OLD.size "
+                "WHERE id = 0; END"
+            )
+            connection.execute(
+                f"INSERT OR IGNORE INTO {self._stats} (id, count, size) "
+                f"SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM {self._table}"
+            )
+
+    @contextmanager
+    def _transaction(self):
+        """Run statements in a write transaction, taking the lock up front so that
+        concurrent writers queue rather than fail"""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def _store(self, key, value, timeout, version, mode):
+        """Write an entry. mode is "REPLACE" to overwrite or "IGNORE" to keep an
+        existing live entry. Returns whether the entry was written."""
+        key = self.make_and_validate_key(key, version=version)
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        with self._transaction() as connection:
+            if mode == "IGNORE":
+                # An expired entry doesn't count as existing
+                connection.execute(
+                    f"DELETE FROM {self._table} WHERE key = ? AND expires <= ?",
+                    [key, now],
+                )
+            cursor = connection.execute(
+                f"INSERT OR {mode} INTO {self._table} "
+                "(key, value, expires, accessed, size) VALUES (?, ?, ?, ?, ?)",
+                [key, value, expires, now, len(value)],
+            )
+            written = cursor.rowcount > 0
+            if written:
+                self._cull(connection, now)
+        return written
+
+    def _totals(self, connection):
+        """Return the number of entries and their total size, from the stats"""
+        return connection.execute(
+            f"SELECT count, size FROM {self._stats} WHERE id = 0"
+        ).fetchone()
+
+    def _cull(self, connection, now):
+        count, size = self._totals(connection)
+        if count <= self._max_entries and size <= self._max_size:
+            return
+        connection.execute(f"DELETE FROM {self._table} WHERE expires <= ?", [now])
+        while True:
+            count, size = self._totals(connection)
+            if count <= self._max_entries and size <= self._max_size:
+                return
+            if self._cull_frequency == 0:
+                connection.execute(f"DELETE FROM {self._table}")
+                return
+            connection.execute(
+                f"DELETE FROM {self._table} WHERE key IN ("
+                f"SELECT key FROM {self._table} ORDER BY accessed LIMIT ?)",
+                [max(count // self._cull_frequency, 1)],
+            )
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._store(key, value, timeout, version, "IGNORE")
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._store(key, value, timeout, version, "REPLACE")
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version=version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        key_map = {
+            self.make_and_validate_key(key, version=version): key for key in keys
+        }
+        if not key_map:
+            return {}
+        now = time.time()
+        connection = self._connection()
+        rows = connection.execute(
+            f"SELECT key, value, accessed FROM {self._table} WHERE key IN "
+            f"({', '.join('?' * len(key_map))}) AND (expires IS NULL OR expires > ?)",
+            [*key_map, now],
+        ).fetchall()
+        stale = [
+            key for key, _, accessed in rows if now - accessed > ACCESS_GRANULARITY
+        ]
+        if stale:
+            with self._transaction() as connection:
+                connection.execute(
+                    f"UPDATE {self._table} SET accessed = ? WHERE key IN "
+                    f"({', '.join('?' * len(stale))})",
+                    [now, *stale],
+                )
+        return {key_map[key]: pickle.loads(value) for key, value, _ in rows}
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                f"UPDATE {self._table} SET expires = ?, accessed = ? "
+                "WHERE key = ? AND (expires IS NULL OR expires > ?)",
+                [self.get_backend_timeout(timeout), now, key, now],
+            )
+        return cursor.rowcount > 0
+
+    def delete(self, key, version=None):
+        return self._delete_many([self.make_and_validate_key(key, version=version)])
+
+    def delete_many(self, keys, version=None):
+        self._delete_many(
+            [self.make_and_validate_key(key, version=version) for key in keys]
+        )
+
+    def _delete_many(self, keys):
+        if not keys:
+            return False
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                f"DELETE FROM {self._table} "
+                f"WHERE key IN ({', '.join('?' * len(keys))})",
+                keys,
+            )
+        return cursor.rowcount > 0
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return (
+            self._connection()
+            .execute(
+                f"SELECT 1 FROM {self._table} WHERE key = ? "
+                "AND (expires IS NULL OR expires > ?)",
+                [key, time.time()],
+            )
+            .fetchone()
+            is not None
+        )
+
+    def clear(self):
+        with self._transaction() as connection:
+            connection.execute(f"DELETE FROM {self._table}")
+
+    def close(self, **kwargs):
+        # Connections are kept open for the life of the thread, as opening one means
+        # reading the schema again
+        pass
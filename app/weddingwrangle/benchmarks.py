@@ -0,0 +1,474 @@
+"""Benchmarks of the pages and scripts which slow down as the guestlist grows.
+
+Each benchmark runs against synthetic guests from the generate_guests command, in a
+scratch database which is thrown away afterwards, so the real guestlist is never
+touched. Caches are cleared before every run, so the numbers are for the work itself
+rather than for reading a cached copy. Wall time is the median of the timed runs.
+Memory is measured in one extra run, as tracing allocations slows everything else
+down.
+
+Run them with the benchmark management command. The query budget tests (tests.py)
+and the check_query_budget command use the same setup to check that views make a
+fixed number of queries.
+"""
+
+import csv
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from contextlib import ExitStack, chdir, contextmanager
+from io import StringIO
+from typing import Callable, NamedTuple, Optional
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.urls import reverse
+from weddingwrangle import counters
+from weddingwrangle.middleware import QueryRecorder
+from weddingwrangle.models import Audience, Email, Guest, Position, RSVPStatus, Title
+from weddingwrangle.scripts import sync
+
+
+class Benchmark(NamedTuple):
+    name: str
+    # Called with the benchmark context, outside the timer, before every run. Its
+    # return value is passed on to run.
+    prepare: Optional[Callable]
+    run: Callable
+
+
+class QueryBudget(NamedTuple):
+    name: str
+    # The most queries the view may make. Whatever this is, it mustn't make more for
+    # more guests.
+    budget: int
+    prepare: Optional[Callable]
+    run: Callable
+
+
+class Context:
+    """What benchmarks share at one dataset size: a client logged in as an organiser
+    and an anonymous one for guests' pages, and a scratch directory"""
+
+    def __init__(self, user, directory):
+        self.directory = directory
+        self.client = Client()
+        self.client.force_login(user)
+        self.guest_client = Client()
+        # Guests with partners, as saving a guest also refreshes their partner's
+        # pages, so that every RSVP makes the same queries
+        self.pending = iter(
+            Guest.objects.filter(rsvp_status__name="Pending", partner__isnull=False)
+            .exclude(email_address="")
+            .order_by("pk")
+            .values_list("rsvp_link", "email_address")
+        )
+        self.accepted = RSVPStatus.objects.get(name="Accepted").pk
+
+
+def check(response):
+    if response.status_code >= 400:
+        raise AssertionError(f"Responded with {response.status_code}")
+    # Streamed responses aren't generated until they're read
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    return response
+
+
+def get(path):
+    return lambda context, _: check(context.client.get(path))
+
+
+def export_qr(context, _):
+    # The export writes its images and zip file relative to the working directory
+    with chdir(context.directory):
+        check(context.client.get(reverse("guest_export_qr")))
+
+
+def prepare_rsvp(context):
+    """Pick a guest who has yet to reply, so that every run is a first RSVP"""
+    guest = next(context.pending, None)
+    if guest is None:
+        raise AssertionError("There are no more pending guests to RSVP")
+    return guest
+
+
+def post_rsvp(context, guest):
+    rsvp_link, email_address = guest
+    check(
+        context.guest_client.post(
+            reverse("rsvp", args=[rsvp_link]),
+            {
+                "email_address": email_address,
+                "rsvp_status": context.accepted,
+                "dietaries": [],
+                "dietary_other": "",
+            },
+        )
+    )
+
+
+def prepare_email(context):
+    mail.outbox = []
+    return Email.objects.create(
+        subject="Benchmark",
+        text="Dear {{ guest_name }},\r\n\r\nSee you soon\r\n\r\n{{ rsvp_url }}",
+        audience=Audience.objects.get(name="All potential guests (excludes Declined)"),
+    )
+
+
+def send_email(context, email):
+    check(context.client.post(reverse("email_confirm", args=[email.pk])))
+
+
+def export_guests_csv():
+    """Write the guestlist in the importer's format: the same as import_data.csv.
+    The importer finds partners by name, so each surname is made unique."""
+    file = StringIO()
+    writer = csv.writer(file)
+    writer.writerow(
+        [
+            "ID",
+            "Title",
+            "First name",
+            "Surname",
+            "Email address",
+            "Position",
+            "RSVP",
+            "RSVP at",
+            "Partner first name",
+            "Partner surname",
+            "Dietaries",
+        ]
+    )
+    for guest in Guest.objects.with_related():
+        writer.writerow(
+            [
+                guest.pk,
+                guest.title.name,
+                guest.first_name,
+                f"{guest.surname} {guest.pk}",
+                guest.email_address,
+                guest.position.name,
+                guest.rsvp_status.name,
+                "",
+                guest.partner.first_name if guest.partner else "",
+                f"{guest.partner.surname} {guest.partner.pk}" if guest.partner else "",
+                [dietary.name for dietary in guest.dietaries.all()],
+            ]
+        )
+    return file.getvalue().encode()
+
+
+def upload_csv(context, data):
+    check(
+        context.client.post(
+            reverse("guest_upload"),
+            {"csv": SimpleUploadedFile("guests.csv", data, "text/csv")},
+        )
+    )
+
+
+# In the order they're run. The upload replaces every guest, so it comes last.
+BENCHMARKS = (
+    Benchmark("home", None, get("/")),
+    Benchmark("guest_list", None, get("/guests/")),
+    Benchmark("export_csv", None, get("/guests/export/csv/")),
+    Benchmark("export_qr", None, export_qr),
+    Benchmark("rsvp_post", prepare_rsvp, post_rsvp),
+    Benchmark("email_confirm", prepare_email, send_email),
+    Benchmark("sync", None, lambda context, _: sync.run()),
+    Benchmark("guest_upload", lambda context: export_guests_csv(), upload_csv),
+)
+
+
+def first_guest(context):
+    """A guest with a partner and an email address, to view the pages of"""
+    return (
+        Guest.objects.filter(partner__isnull=False)
+        .exclude(email_address="")
+        .values_list("pk", "rsvp_link")
+        .first()
+    )
+
+
+def first_sent_email(context):
+    return Email.objects.filter(date_sent__isnull=False).values_list("pk", flat=True)[0]
+
+
+def get_page(name, argument=lambda prepared: prepared):
+    """Get the page of a URL pattern whose argument is picked by prepare"""
+    return lambda context, prepared: check(
+        context.client.get(reverse(name, args=[argument(prepared)]))
+    )
+
+
+def get_rsvp_page(context, guest):
+    check(context.guest_client.get(reverse("rsvp", args=[guest[0]])))
+
+
+# Every organiser's page loads their session and user, and their permissions twice
+# for the navigation bar
+ORGANISER_PAGE = 4
+
+# Every view which shows or changes many guests. Each budget is the queries the view
+# needs for its own work plus a few to spare, so that it doesn't have to be raised
+# for every small change, while a query per guest is still caught by the check that
+# the count is the same however many guests there are.
+QUERY_BUDGETS = (
+    # The headline numbers (statuses and counters) and the chart (its first day and
+    # the replies and invitations by day)
+    QueryBudget("home", ORGANISER_PAGE + 8, None, get("/")),
+    # A page of guests with their dietaries, counted for the paginator
+    QueryBudget("guest_list", ORGANISER_PAGE + 8, None, get("/guests/")),
+    # The guest and their dietaries, and the choices of each lookup field
+    QueryBudget(
+        "guest_update",
+        ORGANISER_PAGE + 13,
+        first_guest,
+        get_page("guest_update", lambda guest: guest[0]),
+    ),
+    QueryBudget("export_csv", ORGANISER_PAGE + 4, None, get("/guests/export/csv/")),
+    # The ETag's count and latest change, then a page of guests
+    QueryBudget("api_guest_list", ORGANISER_PAGE + 5, None, get("/api/v1/guests/")),
+    # The audiences' sizes for the form and the sent emails
+    QueryBudget("email_list", ORGANISER_PAGE + 5, None, get("/email/")),
+    QueryBudget(
+        "email_detail", ORGANISER_PAGE + 4, first_sent_email, get_page("email_detail")
+    ),
+    # The audience's counts, recipients and any guests without an email address
+    QueryBudget(
+        "email_confirm",
+        ORGANISER_PAGE + 7,
+        prepare_email,
+        get_page("email_confirm", lambda email: email.pk),
+    ),
+    # Listing the recipients and recording them as sent in one statement
+    QueryBudget("email_send", ORGANISER_PAGE + 7, prepare_email, send_email),
+    # Guests aren't logged in, so these have no overhead: the guest and the choices
+    QueryBudget("rsvp", 8, prepare_rsvp, get_rsvp_page),
+    # Saving the RSVP, resyncing the guest's audiences, keeping the running totals,
+    # publishing the new counts and queueing the confirmation email
+    QueryBudget("rsvp_post", 30, prepare_rsvp, post_rsvp),
+    QueryBudget(
+        "rsvp_thank",
+        ORGANISER_PAGE + 3,
+        first_guest,
+        get_page("rsvp_thank", lambda guest: guest[1]),
+    ),
+)
+
+
+def clear_caches():
+    for cache in caches.all():
+        cache.clear()
+
+
+@contextmanager
+def recording_queries():
+    recorder = QueryRecorder()
+    with ExitStack() as stack:
+        for db in connections.all():
+            stack.enter_context(db.execute_wrapper(recorder))
+        yield recorder
+
+
+def measure(benchmark, context, repeat):
+    """Time a benchmark over repeat runs, then run it once more tracing memory"""
+    seconds = []
+    queries = 0
+    for run in range(repeat + 1):
+        prepared = benchmark.prepare(context) if benchmark.prepare else None
+        clear_caches()
+        traced = run == repeat
+        if traced:
+            tracemalloc.start()
+        with recording_queries() as recorder:
+            started = time.perf_counter()
+            benchmark.run(context, prepared)
+            elapsed = time.perf_counter() - started
+        if traced:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            seconds.append(elapsed)
+            queries = max(queries, recorder.count)
+    return {
+        "seconds": round(statistics.median(seconds), 4),
+        "min_seconds": round(min(seconds), 4),
+        "queries": queries,
+        "peak_memory_kb": round(peak / 1024),
+    }
+
+
+def count_queries(benchmark, context):
+    """Run a benchmark once, returning the QueryRecorder of its queries"""
+    prepared = benchmark.prepare(context) if benchmark.prepare else None
+    clear_caches()
+    with recording_queries() as recorder:
+        benchmark.run(context, prepared)
+    return recorder
+
+
+@contextmanager
+def scratch_database():
+    """Run against a new, empty database. SQLite's is a file rather than in memory,
+    as the real one is."""
+    with ExitStack() as stack:
+        if connection.vendor == "sqlite":
+            directory = stack.enter_context(tempfile.TemporaryDirectory())
+            connection.settings_dict.setdefault("TEST", {})["NAME"] = os.path.join(
+                directory, "benchmark.sqlite3"
+            )
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def benchmark_settings(directory):
+    """Settings which keep benchmarks away from the real caches, mail server and
+    event log, and stop debugging from recording every query"""
+    return override_settings(
+        DEBUG=False,
+        ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+        CACHES={
+            name: {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "LOCATION": f"benchmark-{name}",
+            }
+            for name in settings.CACHES
+        },
+        EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+        RSVP_EVENTS_PATH=os.path.join(directory, "rsvp_events.jsonl"),
+        STORAGES={
+            **settings.STORAGES,
+            # Hashed names need collectstatic to have been run
+            "staticfiles": {
+                "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+            },
+        },
+        REQUEST_TIMING=False,
+        PROFILING=False,
+    )
+
+
+@contextmanager
+def scratch_environment(new_database=True):
+    """Set up the scratch settings, directory and (unless new_database is False, as
+    under the test runner, which has made one already) database, returning the
+    directory and an organiser to log in as"""
+    with ExitStack() as stack:
+        directory = stack.enter_context(tempfile.TemporaryDirectory())
+        stack.enter_context(benchmark_settings(directory))
+        if new_database:
+            stack.enter_context(scratch_database())
+        os.makedirs(os.path.join(directory, "weddingwrangle", "qr_codes"))
+        yield directory, User.objects.create_superuser("benchmark", "", None)
+
+
+def add_uncontactable_guest():
+    """Add a pending guest without an email address. Some views only run a query
+    when there are such guests (to list them), so with one in every guestlist they
+    make the same queries at every size."""
+    guest = Guest(
+        title=Title.objects.order_by("pk").first(),
+        first_name="Uncontactable",
+        surname="Guest",
+        position=Position.objects.get(name="Guest"),
+        rsvp_status=RSVPStatus.objects.get(name="Pending"),
+        rsvp_link="uncontactable",
+    )
+    with counters.track(guest):
+        guest.save()
+        sync.sync_audience(guest)
+
+
+def guestlists(sizes, seed=0, new_database=True):
+    """Generate each size of guestlist in turn in a scratch environment, yielding the
+    size and a Context for it"""
+    with scratch_environment(new_database) as (directory, user):
+        for size in sizes:
+            call_command(
+                "generate_guests", guests=size, seed=seed, clear=True, stdout=StringIO()
+            )
+            add_uncontactable_guest()
+            yield size, Context(user, directory)
+
+
+def count_budget_queries(sizes, seed=0, new_database=True):
+    """Run every view with a query budget at each number of guests, returning their
+    QueryRecorders by view name and then size"""
+    recorders = {view.name: {} for view in QUERY_BUDGETS}
+    for size, context in guestlists(sizes, seed, new_database):
+        for view in QUERY_BUDGETS:
+            recorders[view.name][size] = count_queries(view, context)
+    return recorders
+
+
+def run_benchmarks(sizes, repeat=3, seed=0, names=None, log=None):
+    """Run the benchmarks (or those named) at each number of guests. A benchmark which
+    fails is reported with its error rather than stopping the others. Returns a list
+    of results."""
+    benchmarks = [b for b in BENCHMARKS if names is None or b.name in names]
+    results = []
+    for size, context in guestlists(sizes, seed):
+        for benchmark in benchmarks:
+            result = {"benchmark": benchmark.name, "guests": size}
+            try:
+                result.update(measure(benchmark, context, repeat))
+            except Exception as error:
+                result["error"] = repr(error)
+            results.append(result)
+            if log:
+                log(result)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Compare results with a baseline's, returning a line for each benchmark and a
+    list of regressions: runs more than tolerance (a fraction) slower, or making more
+    queries, or failing where they used to pass"""
+    previous = {(r["benchmark"], r["guests"]): r for r in baseline["results"]}
+    lines = []
+    regressions = []
+    for result in results:
+        key = (result["benchmark"], result["guests"])
+        label = f"{result['benchmark']} at {result['guests']} guests"
+        before = previous.get(key)
+        if before is None:
+            lines.append(f"{label}: not in the baseline")
+            continue
+        if "error" in result:
+            lines.append(f"{label}: failed ({result['error']})")
+            if "error" not in before:
+                regressions.append(f"{label} failed")
+            continue
+        if "error" in before:
+            lines.append(f"{label}: fixed, {result['seconds']:.3f}s")
+            continue
+        change = result["seconds"] / before["seconds"] - 1 if before["seconds"] else 0
+        lines.append(
+            f"{label}: {before['seconds']:.3f}s -> {result['seconds']:.3f}s "
+            f"({change:+.0%}), {before['queries']} -> {result['queries']} queries, "
+            f"{before['peak_memory_kb']} -> {result['peak_memory_kb']}KB"
+        )
+        if change > tolerance:
+            regressions.append(f"{label} is {change:.0%} slower")
+        if result["queries"] > before["queries"]:
+            regressions.append(
+                f"{label} makes {result['queries'] - before['queries']} more queries"
+            )
+    return lines, regressions
@@ -0,0 +1,142 @@
+import hashlib
+from uuid import uuid4
+from django.conf import settings
+from django.core.cache import cache
+from weddingwrangle.models import (
+    Title,
+    Position,
+    RSVPStatus,
+    Dietary,
+    Starter,
+    Main,
+    Email,
+)
+
+RSVP_TEMPLATE_CACHE_KEY = "weddingwrangle:email:" + Email.RSVP_TEMPLATE_KEY
+REFERENCE_VERSION_CACHE_KEY = "weddingwrangle:reference:version"
+GUEST_DATA_VERSION_CACHE_KEY = "weddingwrangle:guest_data:version"
+GUEST_PAGES_VERSION_CACHE_KEY = "weddingwrangle:guest_pages:version:"
+GUEST_PAGE_CACHE_KEY = "weddingwrangle:guest_page:"
+# Not "weddingwrangle:user:", under which whole users (password hash and all) used to
+# be cached, so that those entries are never read back
+USER_CACHE_KEY = "weddingwrangle:user_fields:"
+
+# Lookup tables which are edited through the admin but almost never change
+REFERENCE_MODELS = (Title, Position, RSVPStatus, Dietary, Starter, Main)
+
+# Reference data is held in each process, tagged with the version stamp it was loaded
+# under. The stamp lives in the shared cache, so a change saved by one worker is seen
+# by every other worker the next time it checks the stamp.
+_reference_data = {"version": None, "objects": {}}
+
+
+def get_rsvp_email_template():
+    """Return the email sent to guests when they RSVP, from the cache if possible"""
+    email = cache.get(RSVP_TEMPLATE_CACHE_KEY)
+    if email is None:
+        email = Email.objects.get(key=Email.RSVP_TEMPLATE_KEY)
+        cache.set(RSVP_TEMPLATE_CACHE_KEY, email, None)
+    return email
+
+
+def invalidate_rsvp_email_template():
+    cache.delete(RSVP_TEMPLATE_CACHE_KEY)
+
+
+def get_version(key):
+    """Return the version stamp stored under key, creating one if there isn't one"""
+    version = cache.get(key)
+    if version is None:
+        version = uuid4().hex
+        # add() rather than set(), so that two workers starting together agree
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def get_reference_version():
+    return get_version(REFERENCE_VERSION_CACHE_KEY)
+
+
+def invalidate_reference_data():
+    cache.set(REFERENCE_VERSION_CACHE_KEY, uuid4().hex, None)
+
+
+def get_guest_data_version():
+    """Return a stamp which changes whenever any guest is saved or deleted, to key
+    anything built from the whole guestlist, such as the home page chart"""
+    return get_version(GUEST_DATA_VERSION_CACHE_KEY)
+
+
+def invalidate_guest_data():
+    cache.set(GUEST_DATA_VERSION_CACHE_KEY, uuid4().hex, None)
+
+
+def invalidate_guests(*rsvp_links):
+    """Drop everything cached from the guests with these RSVP links: their pages and
+    anything built from the whole guestlist"""
+    invalidate_guest_pages(*rsvp_links)
+    invalidate_guest_data()
+
+
+def get_reference_data(name, loader):
+    """Return the value loaded by loader(), calling it at most once per version of
+    the reference data"""
+    version = get_reference_version()
+    if _reference_data["version"] != version:
+        _reference_data["version"] = version
+        _reference_data["objects"] = {}
+    objects = _reference_data["objects"]
+    if name not in objects:
+        objects[name] = loader()
+    return objects[name]
+
+
+def get_reference_objects(model):
+    """Return every row of a reference model, loading it at most once per version"""
+    return get_reference_data(model, lambda: list(model.objects.order_by("pk")))
+
+
+def get_guest_page_key(request, rsvp_link):
+    """Return the cache key for a guest's RSVP page, or None if the page shouldn't be
+    cached for this request. Every page for the guest is keyed under a version stamp
+    so that they can all be invalidated at once when the guest is saved, and under the
+    reference data's, since the forms list the RSVP statuses, dietary requirements
+    and so on."""
+    # Organisers get the full navigation bar, so only guests' pages are cached
+    if settings.SESSION_COOKIE_NAME in request.COOKIES:
+        return None
+    # Pages with forms carry a CSRF token tied to the browser's CSRF cookie. Without
+    # a cookie, rendering the page will set a new one, so it can't be reused.
+    csrf_cookie = request.COOKIES.get(settings.CSRF_COOKIE_NAME)
+    if csrf_cookie is None:
+        return None
+    version_key = GUEST_PAGES_VERSION_CACHE_KEY + rsvp_link
+    version = cache.get(version_key)
+    if version is None:
+        version = uuid4().hex
+        cache.add(version_key, version, settings.PAGE_CACHE_SECONDS)
+    csrf_hash = hashlib.sha256(csrf_cookie.encode("utf-8")).hexdigest()
+    return "{}{}:{}:{}:{}".format(
+        GUEST_PAGE_CACHE_KEY, version, get_reference_version(), request.path, csrf_hash
+    )
+
+
+def invalidate_guest_pages(*rsvp_links):
+    cache.delete_many([GUEST_PAGES_VERSION_CACHE_KEY + link for link in rsvp_links])
+
+
+def get_user(user_id, loader):
+    """Return what's cached of the user with this ID, calling loader() to fetch it if
+    it isn't. Returns None, without caching it, if loader() does."""
+    key = USER_CACHE_KEY + str(user_id)
+    user = cache.get(key)
+    if user is None:
+        user = loader()
+        if user is not None:
+            cache.set(key, user, settings.USER_CACHE_SECONDS)
+    return user
+
+
+def invalidate_user(user_id):
+    cache.delete(USER_CACHE_KEY + str(user_id))
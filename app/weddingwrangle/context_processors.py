@@ -1,5 +1,14 @@
 from django.conf import settings
+from django.urls import reverse
 
 def app_name(request):
     return {"APP_NAME": settings.APP_NAME}
 
+
+def rsvp_events_url(request):
+    """The stream of live RSVP updates, or an empty string if live updates are off"""
+    return {
+        "RSVP_EVENTS_URL": (
+            reverse("rsvp_events") if settings.RSVP_EVENTS_STREAM_SECONDS else ""
+        )
+    }
@@ -0,0 +1,226 @@
+"""Running totals of guests by RSVP status and audience, so that the numbers organisers
+look at most are read from a few rows of SummaryCounter rather than counted.
+
+Code which changes guests one at a time wraps the change in track(), which finds
+what the guests counted towards before and after and adjusts the difference in the
+same transaction. Guests deleted any other way, such as along with the title,
+position, menu choice or RSVP status they belong to, are uncounted just before they
+go by uncount() (see signals.py). Bulk changes (the importer and resyncing audiences)
+call rebuild() instead, which counts everything again. The reconcile_counters
+command calls it too, reporting any drift it finds.
+"""
+
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.db import connection, transaction
+from django.db.models import BigIntegerField, Case, Count, F, Q, Value, When
+from weddingwrangle import audiences, caching
+from weddingwrangle.models import Audience, Guest, RSVPStatus, SummaryCounter
+
+# The guests whose deletion is already accounted for, by track() or, for every guest
+# (ALL), by a bulk change which calls rebuild() afterwards
+ALL = object()
+accounted_for = ContextVar("accounted_for", default=frozenset())
+
+
+def counted_keys(guest_ids, lock=False):
+    """Return a Counter of the counters which these stored guests count towards, in
+    one query. Guests which don't exist (any more) count towards nothing. With lock,
+    the guests' rows stay locked until the transaction ends."""
+    guests = Guest.objects.filter(pk__in=guest_ids)
+    if lock:
+        # Only the guests: their audiences are on the nullable side of the join
+        guests = guests.select_for_update(of=("self",))
+    keys = Counter()
+    counted = set()
+    # One row per audience the guest belongs to, or a single row with no audience
+    for pk, rsvp_status_id, email_address, audience_id in guests.values_list(
+        "pk", "rsvp_status_id", "email_address", "audiences"
+    ):
+        if pk not in counted:
+            counted.add(pk)
+            keys[SummaryCounter.GUESTS] += 1
+            keys[SummaryCounter.rsvp_status_key(rsvp_status_id)] += 1
+            if not email_address:
+                keys[SummaryCounter.UNCONTACTABLE] += 1
+        if audience_id is not None:
+            keys[SummaryCounter.audience_key(audience_id)] += 1
+            if not email_address:
+                keys[SummaryCounter.audience_key(audience_id, uncontactable=True)] += 1
+    return keys
+
+
+def take_write_lock(guest_ids):
+    """SQLite has no row locks, so select_for_update() does nothing there. Unless
+    transactions already begin IMMEDIATE (as in the production profile), take the
+    database's write lock with a write which changes nothing before the guests are
+    read, so that a concurrent change waits its turn rather than failing with
+    "database is locked" when it comes to write."""
+    if connection.vendor == "sqlite" and not getattr(
+        connection, "transaction_mode", None
+    ):
+        Guest.objects.filter(pk__in=guest_ids).update(rsvp_status=F("rsvp_status"))
+
+
+def adjust(deltas):
+    """Add each delta to its counter, with one UPDATE however many there are"""
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    updated = SummaryCounter.objects.filter(key__in=deltas).update(
+        value=F("value")
+        + Case(
+            *[When(key=key, then=Value(delta)) for key, delta in deltas.items()],
+            default=Value(0),
+            output_field=BigIntegerField(),
+        )
+    )
+    if updated < len(deltas):
+        # A status or audience which nobody has been counted towards yet
+        existing = set(
+            SummaryCounter.objects.filter(key__in=deltas).values_list("key", flat=True)
+        )
+        for key in sorted(deltas.keys() - existing):
+            _, created = SummaryCounter.objects.get_or_create(
+                key=key, defaults={"value": deltas[key]}
+            )
+            if not created:
+                SummaryCounter.objects.filter(key=key).update(
+                    value=F("value") + deltas[key]
+                )
+
+
+@contextmanager
+def track(*guests):
+    """Adjust the counters for the changes made to these guests inside the block, in
+    the same transaction as the changes. Guests created inside the block are counted
+    once they've been saved, and deleted ones (whose pk is then None) are uncounted.
+
+    Existing guests are locked before they're read, so that two changes to the same
+    guest at once (such as an RSVP submitted twice) are counted one after the other
+    rather than both from the same starting point."""
+    with transaction.atomic():
+        guest_ids = [guest.pk for guest in guests if guest.pk is not None]
+        if guest_ids:
+            take_write_lock(guest_ids)
+        before = counted_keys(guest_ids, lock=True)
+        with accounting_for(guest_ids):
+            yield
+        after = counted_keys([guest.pk for guest in guests if guest.pk is not None])
+        after.subtract(before)
+        adjust(after)
+
+
+@contextmanager
+def accounting_for(guest_ids):
+    """Keep uncount() away from these guests (or ALL of them) inside the block"""
+    current = accounted_for.get()
+    if current is not ALL:
+        current = ALL if guest_ids is ALL else current | frozenset(guest_ids)
+    token = accounted_for.set(current)
+    try:
+        yield
+    finally:
+        accounted_for.reset(token)
+
+
+def uncount(guest):
+    """Take a guest which is about to be deleted off the counters, unless the
+    deletion is already accounted for"""
+    current = accounted_for.get()
+    if current is ALL or guest.pk in current:
+        return
+    deltas = counted_keys([guest.pk])
+    adjust({key: -delta for key, delta in deltas.items()})
+
+
+def forget(*keys):
+    """Delete the counters of an audience or status which no longer exists"""
+    SummaryCounter.objects.filter(key__in=keys).delete()
+
+
+def count_all():
+    """Count every counter from the guests themselves, with two grouped queries.
+    Every status and stored audience is included, even if nobody counts towards it."""
+    counts = Counter({SummaryCounter.GUESTS: 0, SummaryCounter.UNCONTACTABLE: 0})
+    for pk in RSVPStatus.objects.values_list("pk", flat=True):
+        counts[SummaryCounter.rsvp_status_key(pk)] = 0
+    for pk in Audience.objects.filter(virtual=False).values_list("pk", flat=True):
+        counts[SummaryCounter.audience_key(pk)] = 0
+        counts[SummaryCounter.audience_key(pk, uncontactable=True)] = 0
+
+    for rsvp_status_id, total, uncontactable in (
+        Guest.objects.order_by()
+        .values_list("rsvp_status_id")
+        .annotate(
+            total=Count("pk"), uncontactable=Count("pk", filter=Q(email_address=""))
+        )
+    ):
+        counts[SummaryCounter.GUESTS] += total
+        counts[SummaryCounter.UNCONTACTABLE] += uncontactable
+        counts[SummaryCounter.rsvp_status_key(rsvp_status_id)] = total
+    for audience_id, total, uncontactable in (
+        audiences.GuestAudience.objects.order_by()
+        .values_list("audience_id")
+        .annotate(
+            total=Count("pk"),
+            uncontactable=Count("pk", filter=Q(guest__email_address="")),
+        )
+    ):
+        counts[SummaryCounter.audience_key(audience_id)] = total
+        counts[SummaryCounter.audience_key(audience_id, uncontactable=True)] = (
+            uncontactable
+        )
+    return counts
+
+
+def rebuild(dry_run=False):
+    """Count every counter from scratch and store the results in place of whatever
+    was stored, removing the counters of statuses and audiences which no longer
+    exist (or have become virtual). Returns the drift found, as {key: (stored,
+    actual)}, where actual is None for a counter which was removed."""
+    with transaction.atomic():
+        # Locking the counters holds back tracked changes until the new ones are
+        # stored, so that none are lost in between
+        stored = dict(
+            SummaryCounter.objects.select_for_update().values_list("key", "value")
+        )
+        actual = count_all()
+        drift = {
+            key: (stored.get(key, 0), value)
+            for key, value in actual.items()
+            if stored.get(key, 0) != value
+        }
+        orphans = stored.keys() - actual.keys()
+        drift.update({key: (stored[key], None) for key in orphans})
+        if not dry_run:
+            forget(*orphans)
+            for key in actual.keys() & stored.keys():
+                if stored[key] != actual[key]:
+                    SummaryCounter.objects.filter(key=key).update(value=actual[key])
+            SummaryCounter.objects.bulk_create(
+                [
+                    SummaryCounter(key=key, value=value)
+                    for key, value in actual.items()
+                    if key not in stored
+                ]
+            )
+    return dict(sorted(drift.items()))
+
+
+def summary():
+    """Return the headline numbers: every guest, those without an email address and
+    the guests with each RSVP status by name, in one query"""
+    statuses = caching.get_reference_objects(RSVPStatus)
+    status_keys = {
+        status.name: SummaryCounter.rsvp_status_key(status.pk) for status in statuses
+    }
+    values = SummaryCounter.objects.read(
+        SummaryCounter.GUESTS, SummaryCounter.UNCONTACTABLE, *status_keys.values()
+    )
+    return {
+        "guests": values[SummaryCounter.GUESTS],
+        "uncontactable": values[SummaryCounter.UNCONTACTABLE],
+        "rsvp_statuses": {name: values[key] for name, key in status_keys.items()},
+    }
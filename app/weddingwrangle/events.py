@@ -0,0 +1,129 @@
+"""Live RSVP updates for organisers' dashboards.
+
+Every process shares one append-only file of JSON lines, so an RSVP saved by any
+worker reaches every open stream without a separate message broker. Each event's ID
+is the offset in the file just after its line, which lets a reconnecting browser
+carry on from the Last-Event-ID it sends.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from django.conf import settings
+from django.db import transaction
+from weddingwrangle import counters
+
+logger = logging.getLogger(__name__)
+
+# How often streams check the file for new events, in seconds
+POLL_SECONDS = 1
+# How often an idle stream sends a comment, so that proxies don't close it
+KEEPALIVE_SECONDS = 15
+# How long the browser waits before reconnecting, in milliseconds
+RETRY_MILLISECONDS = 2000
+
+
+def rsvp_counts():
+    """Return the number of guests with each RSVP status, by status name, from the
+    running totals"""
+    return counters.summary()["rsvp_statuses"]
+
+
+def publish_rsvp(guest):
+    """Publish the guest's RSVP once the current transaction commits. The event
+    carries the new counts, so dashboards don't need to query anything themselves."""
+    transaction.on_commit(
+        lambda: write_event(
+            {
+                "guest": guest.pk,
+                "status": guest.rsvp_status.name,
+                "counts": rsvp_counts(),
+            }
+        )
+    )
+
+
+def write_event(event):
+    line = (json.dumps(event, separators=(",", ":")) + "\n").encode("utf-8")
+    try:
+        # A single write to a file opened for appending, so that lines from
+        # different processes are never interleaved
+        fd = os.open(
+            settings.RSVP_EVENTS_PATH, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644
+        )
+        try:
+            if os.fstat(fd).st_size + len(line) > settings.RSVP_EVENTS_MAX_BYTES:
+                # Start afresh rather than growing forever. Streams notice that the
+                # file has shrunk and read it from the start.
+                os.ftruncate(fd, 0)
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+    except OSError:
+        # The RSVP has already been saved, so a broken dashboard shouldn't fail it
+        logger.exception("Couldn't publish RSVP event")
+
+
+class EventReader:
+    """Reads new events from the shared file and formats them as server-sent events"""
+
+    def __init__(self, last_event_id=None):
+        try:
+            self.offset = int(last_event_id)
+        except (TypeError, ValueError):
+            # A new stream only wants events from now on
+            self.offset = self.size()
+        self.last_sent = time.monotonic()
+
+    def size(self):
+        try:
+            return os.path.getsize(settings.RSVP_EVENTS_PATH)
+        except OSError:
+            return 0
+
+    def read(self):
+        """Return any events written since the last read, or a keepalive comment if
+        the stream has been quiet for a while"""
+        size = self.size()
+        if size < self.offset:
+            self.offset = 0
+        messages = []
+        if size > self.offset:
+            with open(settings.RSVP_EVENTS_PATH, "rb") as file:
+                file.seek(self.offset)
+                chunk = file.read(size - self.offset)
+            # Stop at the last complete line, in case one is still being written
+            for line in chunk[: chunk.rfind(b"\n") + 1].splitlines(keepends=True):
+                self.offset += len(line)
+                messages.append(
+                    f"id: {self.offset}\nevent: rsvp\ndata: {line.decode('utf-8')}\n"
+                )
+        if not messages and time.monotonic() - self.last_sent > KEEPALIVE_SECONDS:
+            messages.append(": keepalive\n\n")
+        if messages:
+            self.last_sent = time.monotonic()
+        return messages
+
+
+def stream_events(last_event_id=None):
+    """Yield server-sent events until RSVP_EVENTS_STREAM_SECONDS have passed. The
+    browser then reconnects, so a sync worker isn't held by one dashboard forever."""
+    reader = EventReader(last_event_id)
+    deadline = time.monotonic() + settings.RSVP_EVENTS_STREAM_SECONDS
+    yield f"retry: {RETRY_MILLISECONDS}\n\n"
+    while time.monotonic() < deadline:
+        yield from reader.read()
+        time.sleep(POLL_SECONDS)
+
+
+async def astream_events(last_event_id=None):
+    """As stream_events, but sleeping without blocking an ASGI worker"""
+    reader = EventReader(last_event_id)
+    deadline = time.monotonic() + settings.RSVP_EVENTS_STREAM_SECONDS
+    yield f"retry: {RETRY_MILLISECONDS}\n\n"
+    while time.monotonic() < deadline:
+        for message in reader.read():
+            yield message
+        await asyncio.sleep(POLL_SECONDS)
@@ -1,4 +1,6 @@
 from django import forms
+from django.urls import reverse_lazy
+from weddingwrangle import caching, counters, events, metrics
 from weddingwrangle.models import Guest, Audience, Email
 from weddingwrangle.scripts import csv_import
 from django.utils import timezone
@@ -19,6 +21,63 @@ def rsvp_time_update(self, form_instance):
     return form_instance
 
 
+def use_cached_choices(form):
+    """Build the choices of any reference data fields from the reference data cache
+    rather than querying each table whenever the form is rendered"""
+    for field in form.fields.values():
+        if not isinstance(field, forms.ModelChoiceField):
+            continue
+        model = field.queryset.model
+        if model not in caching.REFERENCE_MODELS:
+            continue
+        choices = [
+            (obj.pk, field.label_from_instance(obj))
+            for obj in caching.get_reference_objects(model)
+        ]
+        if field.empty_label is not None and not isinstance(
+            field, forms.ModelMultipleChoiceField
+        ):
+            choices.insert(0, ("", field.empty_label))
+        field.choices = choices
+
+
+class GuestSearchSelect(forms.Select):
+    """A select which renders only the chosen guest, searching the others through the
+    guest_search view as the user types, rather than rendering every guest. It uses the
+    copy of Select2 which ships with Django's admin."""
+
+    class Media:
+        css = {"all": ["admin/css/vendor/select2/select2.min.css"]}
+        js = ["admin/js/vendor/select2/select2.full.min.js", "guest_search.js"]
+
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        attrs = super().build_attrs(base_attrs, extra_attrs)
+        attrs["data-search-url"] = reverse_lazy("guest_search")
+        attrs["class"] = (attrs.get("class", "") + " guest-search").strip()
+        return attrs
+
+    def optgroups(self, name, value, attrs=None):
+        field = self.choices.field
+        choices = [] if field.empty_label is None else [("", field.empty_label)]
+        selected = [pk for pk in value if pk not in field.empty_values]
+        choices += [
+            (guest.pk, field.label_from_instance(guest))
+            for guest in field.queryset.filter(pk__in=selected)
+        ]
+        return [
+            (
+                None,
+                [
+                    self.create_option(
+                        name, pk, label, str(pk) in value, index, attrs=attrs
+                    )
+                ],
+                index,
+            )
+            for index, (pk, label) in enumerate(choices)
+        ]
+
+
 class CustomModelChoiceField(forms.ModelChoiceField):
     def label_from_instance(self, obj):
         return obj.verbose_name
@@ -34,17 +93,27 @@ class RSVPForm(forms.ModelForm):
 
         super().__init__(*args, **kwargs)
         self.fields["rsvp_status"].label_from_instance = lambda obj: obj.verbose_name
+        use_cached_choices(self)
 
     def save(self, commit=True):
         # Override ModelForm's save method
         form_instance = super().save(commit=False)
         form_instance = rsvp_time_update(self, form_instance)
-        form_instance = sync.sync_audience(form_instance)
         if commit:
-            form_instance.save()
-            self.save_m2m()
+            with counters.track(form_instance):
+                form_instance.save()
+                self.save_m2m()
+            metrics.RSVPS.labels(status=form_instance.rsvp_status.name).inc()
+            if "rsvp_status" in self.changed_data:
+                events.publish_rsvp(form_instance)
         return form_instance
 
+    def _save_m2m(self):
+        # Audiences can only be synced once the guest has been saved, which is also
+        # when save_m2m() is called
+        super()._save_m2m()
+        sync.sync_audience(self.instance)
+
     class Meta:
         model = Guest
         fields = [
@@ -87,7 +156,15 @@ class GuestForm(forms.ModelForm):
             "dietary_other",
             "partner",
         ]
-        widgets = {"dietaries": forms.CheckboxSelectMultiple}
+        widgets = {
+            "dietaries": forms.CheckboxSelectMultiple,
+            # Searches guests as the user types, rather than rendering every guest
+            "partner": GuestSearchSelect,
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        use_cached_choices(self)
 
     def save(self, commit=True):
         # Override ModelForm's save method
@@ -98,20 +175,26 @@ class GuestForm(forms.ModelForm):
             form_instance.rsvp_link = csv_import.generate_key()
         form_instance = rsvp_time_update(self, form_instance)
 
+        if commit:
+            with counters.track(form_instance):
+                form_instance.save()
+                self.save_m2m()
+        return form_instance
+
+    def _save_m2m(self):
+        # Audiences and partners can only be synced once the guest has been saved,
+        # which is also when save_m2m() is called
+        super()._save_m2m()
         if (
-            # The form response rsvp_status is different to the the original record
-            (form_instance.rsvp_status.id != self.initial.get("rsvp_status"))
-            or (form_instance.position.id != self.initial.get("position"))
+            # The form response rsvp_status or position is different to the original
+            # record
+            (self.instance.rsvp_status.id != self.initial.get("rsvp_status"))
+            or (self.instance.position.id != self.initial.get("position"))
         ):
-            form_instance = sync.sync_audience(form_instance)
+            sync.sync_audience(self.instance)
 
         # Autogenerate reciprocal partner relationship
-        form_instance = sync.sync_partner(form_instance)
-
-        if commit:
-            form_instance.save()
-            self.save_m2m()
-        return form_instance
+        sync.sync_partner(self.instance)
 
 
 class NewEmailForm(forms.ModelForm):
@@ -126,6 +209,25 @@ class NewEmailForm(forms.ModelForm):
         ]
         widgets = {"audience": forms.RadioSelect, "text": forms.Textarea}
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Show how many guests each audience would reach
+        self.fields["audience"].choices = [
+            (
+                audience.pk,
+                f"{audience.name} ({audience.member_count} guests, "
+                f"{audience.uncontactable_count} without an email address)",
+            )
+            for audience in Audience.objects.with_sizes()
+        ]
+
+    def clean_audience(self):
+        # Virtual audiences are only evaluated here, when the email is submitted
+        audience = self.cleaned_data["audience"]
+        if not audience.members().exclude(email_address="").exists():
+            raise forms.ValidationError("Nobody in this audience has an email address")
+        return audience
+
 class RSVPEmailTemplate(forms.ModelForm):
     """Extends ModelForm in order to customise field types"""
 
@@ -0,0 +1,105 @@
+import json
+import os
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from weddingwrangle import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the hot pages and scripts at several numbers of synthetic guests, in a "
+        "scratch database, reporting wall time, queries and peak memory as JSON. With "
+        "--baseline, fail if anything has got slower or makes more queries."
+        " Timings depend on the machine, so no baseline is committed: the first run "
+        "with --baseline writes one to that file, and later runs compare with it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            default="100,1000",
+            help="Comma separated numbers of guests to benchmark at",
+        )
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--only",
+            action="append",
+            choices=[benchmark.name for benchmark in benchmarks.BENCHMARKS],
+            help="Only run this benchmark (may be given more than once)",
+        )
+        parser.add_argument("--output", help="Write the results to this file")
+        parser.add_argument(
+            "--baseline",
+            help=(
+                "Compare the results with those saved in this file, or save them "
+                "there if it doesn't exist yet"
+            ),
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.25,
+            help="How much slower than the baseline a benchmark may be, as a fraction",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options["sizes"].split(",")]
+        except ValueError:
+            raise CommandError("--sizes must be a list of numbers, like 100,1000")
+        baseline = None
+        if options["baseline"] and os.path.exists(options["baseline"]):
+            with open(options["baseline"]) as file:
+                baseline = json.load(file)
+            if baseline["seed"] != options["seed"]:
+                raise CommandError(
+                    f"The baseline was run with --seed {baseline['seed']}, so it can "
+                    "only be compared with runs using the same seed"
+                )
+
+        def log(result):
+            if "error" in result:
+                outcome = f"failed: {result['error']}"
+            else:
+                outcome = (
+                    f"{result['seconds']:.3f}s, {result['queries']} queries, "
+                    f"{result['peak_memory_kb']}KB"
+                )
+            self.stderr.write(
+                f"{result['benchmark']} at {result['guests']} guests: {outcome}"
+            )
+
+        report = {
+            "created_at": timezone.now().isoformat(),
+            "repeat": options["repeat"],
+            "seed": options["seed"],
+            "results": benchmarks.run_benchmarks(
+                sizes,
+                repeat=options["repeat"],
+                seed=options["seed"],
+                names=options["only"],
+                log=log,
+            ),
+        }
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                file.write(output + "\n")
+        else:
+            self.stdout.write(output)
+
+        if options["baseline"] and baseline is None:
+            with open(options["baseline"], "w") as file:
+                file.write(output + "\n")
+            self.stderr.write(
+                f"No baseline at {options['baseline']}, so saved these results there"
+            )
+        elif baseline is not None:
+            lines, regressions = benchmarks.compare(
+                report["results"], baseline, options["tolerance"]
+            )
+            for line in lines:
+                self.stderr.write(line)
+            if regressions:
+                raise CommandError("; ".join(regressions))
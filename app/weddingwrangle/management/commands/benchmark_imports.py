@@ -0,0 +1,101 @@
+import os
+import statistics
+import subprocess
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# What a gunicorn worker imports before it can answer its first request: the WSGI
+# application (settings, apps and middleware) and then the URLconf, which imports
+# every view
+WORKER_BOOT = (
+    "import weddingwrangle.wsgi\n"
+    "from django.urls import get_resolver\n"
+    "get_resolver().url_patterns\n"
+)
+
+# Slow imports which only some pages need, so a worker shouldn't load them as it boots
+LAZY_MODULES = ("plotly",)
+
+
+def parse_importtime(output):
+    """Parse python -X importtime output into (module, depth, cumulative µs) rows"""
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        module = name.rstrip()[1:]
+        depth = (len(module) - len(module.lstrip())) // 2
+        rows.append((module.strip(), depth, int(cumulative)))
+    return rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the imports a gunicorn worker makes as it boots, with python -X "
+        "importtime, and fail if they take longer than the threshold or load a module "
+        "which should be imported lazily"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=700,
+            help="The most the median boot may spend importing, in milliseconds",
+        )
+        parser.add_argument("--top", type=int, default=10)
+
+    def boot(self):
+        """Boot a worker in a fresh interpreter, returning its import timings"""
+        env = {
+            **os.environ,
+            "DJANGO_SETTINGS_MODULE": os.environ.get(
+                "DJANGO_SETTINGS_MODULE", "weddingwrangle.settings"
+            ),
+        }
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", WORKER_BOOT],
+            cwd=settings.BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode:
+            raise CommandError(f"The worker failed to boot:\n{result.stderr}")
+        return parse_importtime(result.stderr)
+
+    def handle(self, *args, **options):
+        runs = [self.boot() for _ in range(options["repeat"])]
+        totals = [
+            sum(cumulative for _, depth, cumulative in rows if depth == 0) / 1000
+            for rows in runs
+        ]
+        median = statistics.median(totals)
+        self.stdout.write(
+            f"Worker boot imports: median {median:.0f}ms over {len(runs)} runs "
+            f"(min {min(totals):.0f}ms, max {max(totals):.0f}ms)"
+        )
+
+        # The slowest top-level imports of the median run
+        median_run = runs[totals.index(sorted(totals)[len(totals) // 2])]
+        top_level = sorted(
+            (row for row in median_run if row[1] == 0), key=lambda row: -row[2]
+        )
+        for module, _, cumulative in top_level[: options["top"]]:
+            self.stdout.write(f"  {cumulative / 1000:8.1f}ms  {module}")
+
+        problems = []
+        loaded = {module for module, _, _ in median_run}
+        for lazy_module in LAZY_MODULES:
+            if lazy_module in loaded:
+                problems.append(f"{lazy_module} is imported as the worker boots")
+        if median > options["threshold"]:
+            problems.append(
+                f"Importing took {median:.0f}ms, more than the "
+                f"{options['threshold']:.0f}ms threshold"
+            )
+        if problems:
+            raise CommandError("; ".join(problems))
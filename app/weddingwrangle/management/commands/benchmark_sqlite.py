@@ -0,0 +1,121 @@
+import os
+import random
+import tempfile
+import threading
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connections
+from django.db.utils import load_backend
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare 'database is locked' errors between the stock SQLite settings and "
+        "the production profile, with writer and reader threads sharing a scratch "
+        "database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--writers", type=int, default=8)
+        parser.add_argument("--readers", type=int, default=8)
+        parser.add_argument("--seconds", type=float, default=5)
+        parser.add_argument("--rows", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        profiles = {
+            "stock": ("django.db.backends.sqlite3", {}),
+            "production": (
+                "weddingwrangle.backends.sqlite3",
+                settings.SQLITE_PROFILES["production"],
+            ),
+        }
+        for name, (engine, db_options) in profiles.items():
+            with tempfile.TemporaryDirectory() as directory:
+                results = self.run_profile(
+                    engine, db_options, os.path.join(directory, "bench.sqlite3"), options
+                )
+            self.report(name, results, options["seconds"])
+
+    def connect(self, engine, db_options, path):
+        settings_dict = {
+            **connections["default"].settings_dict,
+            "ENGINE": engine,
+            "NAME": path,
+            "OPTIONS": db_options,
+        }
+        return load_backend(engine).DatabaseWrapper(settings_dict, alias="benchmark")
+
+    def run_profile(self, engine, db_options, path, options):
+        setup = self.connect(engine, db_options, path)
+        with setup.cursor() as cursor:
+            cursor.execute("CREATE TABLE bench (id INTEGER PRIMARY KEY, value INTEGER)")
+            cursor.executemany(
+                "INSERT INTO bench (id, value) VALUES (%s, 0)",
+                [(row,) for row in range(options["rows"])],
+            )
+        setup.close()
+
+        results = {"writes": 0, "write_errors": 0, "reads": 0, "read_errors": 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + options["seconds"]
+
+        def record(key):
+            with lock:
+                results[key] += 1
+
+        def write():
+            # Read then update inside one transaction, like a form save
+            db = self.connect(engine, db_options, path)
+            while time.monotonic() < deadline:
+                row = random.randrange(options["rows"])
+                try:
+                    db.set_autocommit(
+                        False, force_begin_transaction_with_broken_autocommit=True
+                    )
+                    with db.cursor() as cursor:
+                        cursor.execute("SELECT value FROM bench WHERE id = %s", [row])
+                        value = cursor.fetchone()[0]
+                        cursor.execute(
+                            "UPDATE bench SET value = %s WHERE id = %s", [value + 1, row]
+                        )
+                    db.commit()
+                    record("writes")
+                except DatabaseError:
+                    db.rollback()
+                    record("write_errors")
+                finally:
+                    db.set_autocommit(True)
+            db.close()
+
+        def read():
+            db = self.connect(engine, db_options, path)
+            while time.monotonic() < deadline:
+                try:
+                    with db.cursor() as cursor:
+                        cursor.execute("SELECT COUNT(*), SUM(value) FROM bench")
+                        cursor.fetchone()
+                    record("reads")
+                except DatabaseError:
+                    record("read_errors")
+            db.close()
+
+        threads = [threading.Thread(target=write) for _ in range(options["writers"])]
+        threads += [threading.Thread(target=read) for _ in range(options["readers"])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def report(self, name, results, seconds):
+        def rate(done, errors):
+            attempts = done + errors
+            return 100 * errors / attempts if attempts else 0
+
+        self.stdout.write(
+            f"{name}: {results['writes'] / seconds:.0f} writes/s "
+            f"({rate(results['writes'], results['write_errors']):.1f}% locked), "
+            f"{results['reads'] / seconds:.0f} reads/s "
+            f"({rate(results['reads'], results['read_errors']):.1f}% locked)"
+        )
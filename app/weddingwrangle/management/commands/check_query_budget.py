@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+from weddingwrangle import benchmarks
+
+# How many statements are shown for a view which is over budget
+REPEATED_STATEMENTS = 3
+
+
+class Command(BaseCommand):
+    help = (
+        "Check that each view makes no more queries than its budget, and the same "
+        "number however many guests there are, by running it against small and "
+        "large synthetic guestlists. Views which fail show their most repeated SQL. "
+        "The test suite checks the same at 10 and 1000 guests."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            default="10,1000",
+            help="Comma separated numbers of guests to count queries at",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options["sizes"].split(",")]
+        except ValueError:
+            raise CommandError("--sizes must be a list of numbers, like 10,1000")
+
+        recorders = benchmarks.count_budget_queries(sizes, options["seed"])
+
+        failures = []
+        for view in benchmarks.QUERY_BUDGETS:
+            counts = {
+                size: recorder.count for size, recorder in recorders[view.name].items()
+            }
+            self.stdout.write(
+                f"{view.name}: "
+                + ", ".join(f"{count} at {size} guests" for size, count in counts.items())
+                + f" (budget {view.budget})"
+            )
+            problems = []
+            if max(counts.values()) > view.budget:
+                problems.append(f"over its budget of {view.budget}")
+            if len(set(counts.values())) > 1:
+                problems.append("makes a different number of queries for more guests")
+            if problems:
+                failures.append(f"{view.name} {' and '.join(problems)}")
+                # The largest guestlist's queries show the repetition most clearly
+                worst = recorders[view.name][max(sizes)]
+                for statement in worst.most_repeated(REPEATED_STATEMENTS):
+                    self.stdout.write(
+                        f"    {statement['count']} x {statement['sql'][:300]}"
+                    )
+        if failures:
+            raise CommandError("; ".join(failures))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from weddingwrangle import benchmarks, query_plans
+from weddingwrangle.models import Guest
+
+
+class Command(BaseCommand):
+    help = (
+        "Show the query plans of each hot query against a synthetic guestlist, and "
+        "fail if any of them reads more of a table than it needs"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--guests", type=int, default=1000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        failures = []
+        for _, context in benchmarks.guestlists([options["guests"]], options["seed"]):
+            guest = Guest.objects.filter(partner__isnull=False).first()
+            for hot_query in query_plans.HOT_QUERIES:
+                plans = query_plans.hot_query_plans(hot_query, guest)
+                self.stdout.write(f"{hot_query.name}:")
+                for plan in plans:
+                    for line in plan:
+                        self.stdout.write(f"    {line}")
+                for problem in query_plans.problems(hot_query, plans):
+                    failures.append(f"{hot_query.name}: {problem}")
+        if failures:
+            raise CommandError("; ".join(failures))
@@ -0,0 +1,283 @@
+import random
+import string
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from weddingwrangle import caching
+from weddingwrangle.audiences import GuestAudience, resync_all
+from weddingwrangle.models import (
+    Audience,
+    Dietary,
+    Email,
+    Guest,
+    Main,
+    Position,
+    RSVPStatus,
+    Starter,
+    Title,
+)
+
+GuestDietary = Guest.dietaries.through
+
+FIRST_NAMES = (
+    "Alice", "Amir", "Beccy", "Ben", "Chloe", "Chidi", "Daniel", "Elif", "Emma",
+    "Finn", "Grace", "Hannah", "Harry", "Isla", "Jack", "Jamal", "Kate", "Leo",
+    "Lucy", "Maya", "Mohammed", "Niamh", "Oliver", "Priya", "Rory", "Sam", "Sofia",
+    "Tom", "Wei", "Will", "Yusuf", "Zara",
+)
+SURNAMES = (
+    "Ahmed", "Brown", "Campbell", "Chen", "Davies", "Evans", "Ferguson", "Green",
+    "Hughes", "Jones", "Khan", "Kowalski", "Murphy", "Nguyen", "O'Brien", "Patel",
+    "Roberts", "Robinson", "Singh", "Smith", "Taylor", "Thomas", "Walker", "White",
+    "Williams", "Wilson", "Wright", "Young",
+)
+TITLE_WEIGHTS = {"Mr": 45, "Ms": 45, "Dr": 7, "Mx": 3}
+DIETARY_OTHER = ("Shellfish", "Sesame", "Low FODMAP", "No mushrooms, please")
+
+# Emails sent over the timeline, as the fraction of the way through it they went
+# out, their subject and the audience they went to
+SENT_EMAILS = (
+    (0.05, "Save the date", "All potential guests (excludes Declined)"),
+    (0.5, "Reminder: please RSVP", "All guests yet to RSVP"),
+    (0.8, "Travel and accommodation", "All attending guests"),
+    (0.9, "Last call for RSVPs", "All guests yet to RSVP"),
+    (0.95, "See you soon!", "All attending guests"),
+)
+
+LINK_CHARACTERS = string.ascii_uppercase + string.ascii_lowercase + string.digits
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate realistic synthetic guests for benchmarking, with partners, "
+        "dietaries, menu choices, RSVPs spread over months and sent emails. Guests "
+        "are written in bulk, and the same seed always gives the same guests."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--guests", type=int, default=1000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--months",
+            type=int,
+            default=6,
+            help="How many months before now the invitations went out",
+        )
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Delete every guest and sent email first, rather than adding to them",
+        )
+
+    def handle(self, *args, **options):
+        if options["guests"] < 1 or options["chunk_size"] < 2:
+            raise CommandError("--guests must be at least 1 and --chunk-size 2")
+        started = time.perf_counter()
+        self.rng = random.Random(options["seed"])
+        self.now = timezone.now()
+        self.invited = self.now - timedelta(days=30 * options["months"])
+
+        if not Title.objects.exists():
+            call_command(
+                "loaddata",
+                settings.BASE_DIR / "weddingwrangle" / "initial_data.json",
+                verbosity=0,
+            )
+        if options["clear"]:
+            self.clear()
+        self.load_reference_data()
+
+        first_pk = self.last_pk + 1
+        created = 0
+        while created < options["guests"]:
+            size = min(options["chunk_size"], options["guests"] - created)
+            with transaction.atomic():
+                self.create_chunk(size, needs_couple=created == 0)
+            created += size
+            self.stdout.write(f"Created {created} guests")
+
+        # Explicit primary keys leave some databases' sequences behind
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Guest]):
+                cursor.execute(sql)
+
+        resync_all()
+        emails = self.send_emails(first_pk)
+        # Bulk writes don't send signals, so refresh anything built from the guestlist
+        caching.invalidate_guest_data()
+        self.stdout.write(
+            f"Generated {created} guests and {emails} sent emails in "
+            f"{time.perf_counter() - started:.1f}s"
+        )
+
+    def clear(self):
+        """Delete every guest and sent email with a few set-based statements. Deleting
+        through the ORM would load each guest to send its signals."""
+        with transaction.atomic():
+            for through in (GuestAudience, GuestDietary, Guest.emails.through):
+                through.objects.all().delete()
+            with connection.cursor() as cursor:
+                cursor.execute(f"DELETE FROM {Guest._meta.db_table}")
+            Email.objects.filter(date_sent__isnull=False).delete()
+
+    def load_reference_data(self):
+        self.titles = dict(Title.objects.values_list("name", "pk"))
+        self.title_weights = [TITLE_WEIGHTS.get(name, 1) for name in self.titles]
+        self.positions = dict(Position.objects.values_list("name", "pk"))
+        self.statuses = dict(RSVPStatus.objects.values_list("name", "pk"))
+        self.dietary_ids = list(Dietary.objects.values_list("pk", flat=True))
+        self.starter_ids = list(Starter.objects.values_list("pk", flat=True))
+        self.main_ids = list(Main.objects.values_list("pk", flat=True))
+        self.last_pk = Guest.objects.aggregate(last_pk=Max("pk"))["last_pk"] or 0
+        self.links = set(Guest.objects.values_list("rsvp_link", flat=True))
+        # Only one wedding's worth of couple, however often this is run
+        self.has_couple = Guest.objects.filter(
+            position_id__in=[self.positions["Groom"], self.positions["Bride"]]
+        ).exists()
+
+    def generate_link(self):
+        while True:
+            link = "".join(self.rng.choices(LINK_CHARACTERS, k=10))
+            if link not in self.links:
+                self.links.add(link)
+                return link
+
+    def generate_guest(self, position, surname=None, status=None):
+        rng = self.rng
+        first_name = rng.choice(FIRST_NAMES)
+        surname = surname or rng.choice(SURNAMES)
+        link = self.generate_link()
+        if status is None:
+            status = rng.choices(("Accepted", "Declined", "Pending"), (55, 15, 30))[0]
+
+        # Invitations went out over the first fortnight, and replies come in quickly
+        # at first, tailing off until a rush before the deadline
+        created_at = self.invited + timedelta(seconds=rng.uniform(0, 14 * 86400))
+        rsvp_at = None
+        if status != "Pending":
+            remaining = (self.now - created_at).total_seconds()
+            if rng.random() < 0.8:
+                rsvp_at = created_at + timedelta(
+                    seconds=remaining * rng.betavariate(1, 4)
+                )
+            else:
+                rsvp_at = self.now - timedelta(seconds=remaining * rng.uniform(0, 0.1))
+
+        guest = Guest(
+            title_id=rng.choices(list(self.titles.values()), self.title_weights)[0],
+            first_name=first_name,
+            surname=surname,
+            # The link keeps addresses unique, and most guests give one
+            email_address=(
+                f"{first_name}.{surname}.{link}@example.com".lower().replace("'", "")
+                if rng.random() < 0.85
+                else ""
+            ),
+            position_id=self.positions[position],
+            rsvp_status_id=self.statuses[status],
+            rsvp_link=link,
+            rsvp_at=rsvp_at,
+            created_at=created_at,
+            updated_at=rsvp_at or created_at,
+        )
+        if status == "Accepted" and rng.random() < 0.9:
+            guest.starter_id = rng.choice(self.starter_ids) if self.starter_ids else None
+            guest.main_id = rng.choice(self.main_ids) if self.main_ids else None
+        if rng.random() < 0.02:
+            guest.dietary_other = rng.choice(DIETARY_OTHER)
+        guest.status = status
+        return guest
+
+    def create_chunk(self, size, needs_couple):
+        """Create size guests, around two thirds of them in couples"""
+        rng = self.rng
+        guests = []
+        couples = []
+        if needs_couple and not self.has_couple and size >= 2:
+            couples.append(
+                (self.generate_guest("Groom", status="Accepted"),
+                 self.generate_guest("Bride", status="Accepted"))
+            )
+            guests.extend(couples[0])
+        while len(guests) < size:
+            guest = self.generate_guest("Guest")
+            guests.append(guest)
+            if len(guests) < size and rng.random() < 0.5:
+                # Couples mostly share a surname and nearly always reply together
+                partner = self.generate_guest(
+                    "Guest",
+                    surname=guest.surname if rng.random() < 0.6 else None,
+                    status=guest.status if rng.random() < 0.9 else None,
+                )
+                partner.created_at = guest.created_at
+                if partner.rsvp_at and guest.rsvp_at:
+                    partner.rsvp_at = partner.updated_at = guest.rsvp_at
+                guests.append(partner)
+                couples.append((guest, partner))
+
+        # Primary keys are chosen up front, so that partners can be set before the
+        # guests are inserted (the constraint isn't checked until the transaction
+        # commits) rather than with a slow bulk_update afterwards
+        for guest in guests:
+            self.last_pk += 1
+            guest.pk = self.last_pk
+        for guest, partner in couples:
+            guest.partner_id = partner.pk
+            partner.partner_id = guest.pk
+        timeline = [(guest.created_at, guest.updated_at) for guest in guests]
+        Guest.objects.bulk_create(guests, batch_size=1000)
+
+        # created_at and updated_at are always set to now on creation, so the
+        # timeline is written afterwards
+        adapt = connection.ops.adapt_datetimefield_value
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"UPDATE {Guest._meta.db_table} "
+                "SET created_at = %s, updated_at = %s WHERE id = %s",
+                [
+                    (adapt(created_at), adapt(updated_at), guest.pk)
+                    for (created_at, updated_at), guest in zip(timeline, guests)
+                ],
+            )
+
+        dietaries = []
+        for guest in guests:
+            if self.dietary_ids and rng.random() < 0.15:
+                for dietary_id in rng.sample(self.dietary_ids, rng.choice((1, 1, 2))):
+                    dietaries.append(
+                        GuestDietary(guest_id=guest.pk, dietary_id=dietary_id)
+                    )
+        GuestDietary.objects.bulk_create(dietaries, batch_size=1000)
+
+    def send_emails(self, first_pk):
+        """Record the emails sent to each audience along the timeline. Each went to
+        the members with an email address who had been invited by then. Guests from
+        earlier runs already have theirs, so only those from first_pk on are added."""
+        audiences = dict(Audience.objects.values_list("name", "pk"))
+        span = self.now - self.invited
+        sent = 0
+        for fraction, subject, audience_name in SENT_EMAILS:
+            if audience_name not in audiences:
+                continue
+            date_sent = self.invited + span * fraction
+            email = Email.objects.filter(
+                subject=subject, date_sent__isnull=False
+            ).first() or Email.objects.create(
+                subject=subject,
+                text=f"Dear {{{{ guest_name }}}},\r\n\r\n{subject}\r\n\r\nLove,\r\n"
+                "Beccy & Will",
+                date_sent=date_sent,
+                audience_id=audiences[audience_name],
+            )
+            email.audience.members().exclude(email_address="").filter(
+                pk__gte=first_pk, created_at__lte=email.date_sent
+            ).mark_sent(email)
+            sent += 1
+        return sent
@@ -0,0 +1,103 @@
+import re
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, Request, build_opener
+from django.core.management.base import BaseCommand, CommandError
+from weddingwrangle.models import Guest
+
+CSRF_TOKEN = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test the RSVP pages of a running server, to compare how many concurrent "
+        "guests one process can serve under the sync (gunicorn) and async (uvicorn) "
+        "deployments. Run it once against each with the same options."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://localhost:8000")
+        parser.add_argument("--concurrency", type=int, default=20)
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument(
+            "--post",
+            action="store_true",
+            help=(
+                "Submit each guest's current RSVP again after loading the form. Only "
+                "guests without email addresses are used, so nothing is emailed."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        guests = Guest.objects.all()
+        if options["post"]:
+            guests = guests.filter(email_address="")
+        # Each guest's current answers, so that posting them back changes nothing
+        guests = [
+            {
+                "rsvp_link": guest.rsvp_link,
+                "rsvp_status": guest.rsvp_status_id,
+                "dietaries": [dietary.pk for dietary in guest.dietaries.all()],
+                "dietary_other": guest.dietary_other,
+                "starter": guest.starter_id or "",
+                "main": guest.main_id or "",
+            }
+            for guest in guests.prefetch_related("dietaries")
+        ]
+        if not guests:
+            raise CommandError("There are no suitable guests to RSVP as")
+
+        base_url = options["url"].rstrip("/")
+        jobs = [guests[i % len(guests)] for i in range(options["requests"])]
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+            results = list(
+                executor.map(
+                    lambda guest: self.rsvp(base_url, guest, options["post"]), jobs
+                )
+            )
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for ok, latency in results if ok)
+        errors = sum(1 for ok, latency in results if not ok)
+        self.stdout.write(
+            f"{len(results)} RSVPs with {options['concurrency']} concurrent guests "
+            f"in {elapsed:.1f}s: {len(results) / elapsed:.1f} RSVPs/s, {errors} errors"
+        )
+        if latencies:
+            quantiles = statistics.quantiles(latencies, n=100)
+            self.stdout.write(
+                f"Latency: p50 {quantiles[49] * 1000:.0f}ms, "
+                f"p95 {quantiles[94] * 1000:.0f}ms, "
+                f"p99 {quantiles[98] * 1000:.0f}ms"
+            )
+
+    def rsvp(self, base_url, guest, post):
+        """Load a guest's RSVP form and optionally submit it, returning whether it
+        succeeded and how long it took"""
+        opener = build_opener(HTTPCookieProcessor(CookieJar()))
+        url = f"{base_url}/rsvp/{guest['rsvp_link']}/"
+        started = time.perf_counter()
+        try:
+            page = opener.open(url).read().decode("utf-8")
+            if post:
+                data = {
+                    **guest,
+                    "csrfmiddlewaretoken": CSRF_TOKEN.search(page).group(1),
+                    "email_address": "",
+                }
+                opener.open(
+                    Request(
+                        url,
+                        data=urlencode(data, doseq=True).encode("utf-8"),
+                        headers={"Referer": url},
+                    )
+                ).read()
+        except (HTTPError, URLError, AttributeError):
+            return False, time.perf_counter() - started
+        return True, time.perf_counter() - started
@@ -0,0 +1,41 @@
+import time
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired sessions in small batches, pausing between them so that RSVPs "
+        "aren't kept waiting for the database by one long delete (as they would be by "
+        "clearsessions)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0.1,
+            help="Seconds to wait between batches",
+        )
+
+    def handle(self, *args, **options):
+        if settings.SESSION_MODE == "signed_cookies":
+            self.stdout.write("Sessions are kept in cookies, so there are none to purge")
+            return
+
+        now = timezone.now()
+        deleted = 0
+        while True:
+            batch = list(
+                Session.objects.filter(expire_date__lt=now).values_list(
+                    "session_key", flat=True
+                )[: options["batch_size"]]
+            )
+            if not batch:
+                break
+            deleted += Session.objects.filter(session_key__in=batch).delete()[0]
+            time.sleep(options["pause"])
+        self.stdout.write(f"Deleted {deleted} expired sessions")
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from weddingwrangle import counters
+from weddingwrangle.models import Audience, RSVPStatus, SummaryCounter
+
+
+class Command(BaseCommand):
+    help = (
+        "Count the running totals of guests by RSVP status and audience from scratch, "
+        "report any which had drifted and store the new counts, removing those of "
+        "deleted statuses and audiences"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report drift without correcting it, failing if there is any",
+        )
+
+    def describe(self):
+        """Return a readable name for each counter's key"""
+        names = {
+            SummaryCounter.GUESTS: "Guests",
+            SummaryCounter.UNCONTACTABLE: "Guests without an email address",
+        }
+        for pk, name in RSVPStatus.objects.values_list("pk", "name"):
+            names[SummaryCounter.rsvp_status_key(pk)] = f"RSVP status {name}"
+        for pk, name in Audience.objects.values_list("pk", "name"):
+            names[SummaryCounter.audience_key(pk)] = f"Audience {name}"
+            names[SummaryCounter.audience_key(pk, uncontactable=True)] = (
+                f"Audience {name} without an email address"
+            )
+        return names
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        drift = counters.rebuild(dry_run=dry_run)
+        names = self.describe()
+        for key, (stored, actual) in drift.items():
+            if actual is None:
+                self.stdout.write(f"{key}: stored {stored}, no longer counted")
+                continue
+            self.stdout.write(
+                f"{names.get(key, key)}: stored {stored}, actually {actual} "
+                f"({actual - stored:+d})"
+            )
+        if dry_run and drift:
+            raise CommandError(f"{len(drift)} counters have drifted")
+        verb = "Would correct" if dry_run else "Corrected"
+        self.stdout.write(f"{verb} {len(drift)} counters")
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from weddingwrangle.audiences import resync_all
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild every rule-based audience and make partnerships reciprocal, using a "
+        "few set-based statements in one transaction"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report what would change without writing anything",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        report = resync_all(dry_run=dry_run)
+        verb = "Would" if dry_run else "Did"
+
+        for audience in report["audiences"]:
+            self.stdout.write(
+                f"{audience['audience']}: +{audience['added']} -{audience['removed']}"
+            )
+        for partner in report["partners"]:
+            self.stdout.write(
+                f"{verb} set partner of {partner['guest']} (#{partner['guest_id']}) "
+                f"to #{partner['partner_id']}"
+            )
+        changes = sum(a["added"] + a["removed"] for a in report["audiences"]) + len(
+            report["partners"]
+        )
+        self.stdout.write(f"{verb} make {changes} changes")
@@ -0,0 +1,66 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from weddingwrangle.outbox import MailServerUnavailable, send_queued_emails
+
+# The longest the worker waits before trying an unreachable mail server again, in
+# seconds
+MAX_OUTAGE_INTERVAL = 5 * 60
+
+
+class Command(BaseCommand):
+    help = (
+        "Send queued emails, such as RSVP confirmations, in the background. Emails the "
+        "mail server refuses are retried with exponential backoff, and while the server "
+        "can't be reached the worker waits longer between tries without giving up on "
+        "any email."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Send a single batch and exit instead of polling",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5,
+            help="Seconds to wait between polls when the queue is empty",
+        )
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument(
+            "--max-attempts",
+            type=int,
+            default=10,
+            help="Give up on an email after the mail server refuses it this many times",
+        )
+
+    def handle(self, *args, **options):
+        outages = 0
+        while True:
+            try:
+                sent, failed = send_queued_emails(
+                    batch_size=options["batch_size"],
+                    max_attempts=options["max_attempts"],
+                )
+            except MailServerUnavailable as e:
+                if options["once"]:
+                    raise CommandError(f"Couldn't reach the mail server: {e}")
+                # Wait twice as long after each failed try, so that a long outage
+                # isn't hammered
+                wait = min(options["interval"] * 2**outages, MAX_OUTAGE_INTERVAL)
+                outages += 1
+                self.stderr.write(
+                    f"Couldn't reach the mail server ({e}); trying again in {wait:.0f}s"
+                )
+                time.sleep(wait)
+                continue
+            outages = 0
+            if sent or failed:
+                self.stdout.write(f"Sent {sent} emails, {failed} failed")
+            if options["once"]:
+                return
+            # Go straight on to the next batch if this one was full and the mail
+            # server is healthy; otherwise back off
+            if failed or sent < options["batch_size"]:
+                time.sleep(options["interval"])
@@ -0,0 +1,125 @@
+"""Prometheus metrics, served at /metrics.
+
+Under gunicorn each worker is a separate process with its own counters, so when the
+PROMETHEUS_MULTIPROC_DIR environment variable is set every process writes its
+metrics to memory-mapped files in that directory, and /metrics adds them all up. The
+directory is emptied when gunicorn starts (see gunicorn.conf.py). Without it, as in
+development, /metrics only reports the process which serves it.
+
+Other processes, such as the mailer, write to directories of their own, so that
+gunicorn doesn't delete their files and their process ids can't clash with the
+workers'. /metrics adds in those listed in METRICS_OTHER_DIRS.
+"""
+
+import glob
+import hmac
+import ipaddress
+import os
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.multiprocess import MultiProcessCollector
+
+if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+REQUEST_SECONDS = Histogram(
+    "weddingwrangle_request_seconds",
+    "Time taken to respond to requests, by URL name",
+    ["view", "method"],
+)
+RSVPS = Counter(
+    "weddingwrangle_rsvps",
+    "RSVP forms submitted, by the status chosen",
+    ["status"],
+)
+EMAILS_SENT = Counter("weddingwrangle_emails_sent", "Emails sent")
+EMAIL_FAILURES = Counter(
+    "weddingwrangle_email_failures", "Emails which the mail server didn't accept"
+)
+EMAIL_SEND_SECONDS = Histogram(
+    "weddingwrangle_email_send_seconds", "Time taken to hand an email to the server"
+)
+QR_CODE_SECONDS = Histogram(
+    "weddingwrangle_qr_code_seconds",
+    "Time taken to generate a QR code image",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+CSV_ROWS = Counter(
+    "weddingwrangle_csv_rows",
+    "Guest rows imported from or exported to CSV files",
+    ["direction"],
+)
+
+
+@contextmanager
+def track_email_send():
+    """Time sending an email, counting it as sent or failed by whether it raises"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        EMAIL_FAILURES.inc()
+        raise
+    else:
+        EMAILS_SENT.inc()
+    finally:
+        EMAIL_SEND_SECONDS.observe(time.perf_counter() - started)
+
+
+class MultiDirectoryCollector:
+    """Adds up the metrics files in several directories, as MultiProcessCollector
+    does for one"""
+
+    def __init__(self, directories):
+        self.directories = directories
+
+    def collect(self):
+        files = []
+        for directory in self.directories:
+            files += glob.glob(os.path.join(directory, "*.db"))
+        return MultiProcessCollector.merge(files, accumulate=True)
+
+
+def may_read_metrics(request):
+    """Whether a request may read the metrics: from a scraper sending METRICS_TOKEN as
+    a bearer token, from this host or from a staff user, unless METRICS_PUBLIC opens
+    them to everyone"""
+    if settings.METRICS_PUBLIC:
+        return True
+    if settings.METRICS_TOKEN and hmac.compare_digest(
+        request.headers.get("Authorization", ""), f"Bearer {settings.METRICS_TOKEN}"
+    ):
+        return True
+    try:
+        if ipaddress.ip_address(request.META.get("REMOTE_ADDR", "")).is_loopback:
+            return True
+    except ValueError:
+        pass
+    return request.user.is_staff
+
+
+def metrics_view(request):
+    """Serves every process's metrics in Prometheus' text format, to those allowed by
+    may_read_metrics"""
+    if not may_read_metrics(request):
+        return HttpResponseForbidden()
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        registry.register(
+            MultiDirectoryCollector(
+                [os.environ["PROMETHEUS_MULTIPROC_DIR"], *settings.METRICS_OTHER_DIRS]
+            )
+        )
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,172 @@
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import ExitStack
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from weddingwrangle import metrics, profiling
+
+logger = logging.getLogger(__name__)
+
+# How many statements a slow request's log line lists
+SLOW_REQUEST_STATEMENTS = 5
+
+# Request methods recorded by name in the metrics; any others are counted as "other"
+METRICS_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+
+class QueryRecorder:
+    """A database execute wrapper which counts and times every query, grouped by
+    statement so that repeated (N+1) queries stand out"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+        # Maps each SQL statement to the number of times it ran and their total time
+        self.statements = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.duration += duration
+            runs, total = self.statements.get(sql, (0, 0))
+            self.statements[sql] = (runs + 1, total + duration)
+
+    def most_repeated(self, limit):
+        statements = sorted(
+            self.statements.items(), key=lambda item: item[1], reverse=True
+        )
+        return [
+            {"sql": sql, "count": runs, "ms": round(total * 1000, 1)}
+            for sql, (runs, total) in statements[:limit]
+        ]
+
+
+class RequestTimingMiddleware:
+    """Times each request's queries, template rendering and view, and reports them in
+    a Server-Timing header and a JSON log line. Requests slower than
+    REQUEST_TIMING_SLOW_MS are logged as warnings with their most repeated SQL.
+
+    This should be first in MIDDLEWARE, so that it times everything else. Unless
+    REQUEST_TIMING is set it removes itself at startup, so costs nothing."""
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        request._timing = {"render": 0}
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+        render = request._timing["render"]
+
+        timings = {
+            "total": total,
+            "view": total - render,
+            "render": render,
+            "db": recorder.duration,
+        }
+        response["Server-Timing"] = ", ".join(
+            [f"{name};dur={duration * 1000:.1f}" for name, duration in timings.items()]
+            + [f'queries;desc="{recorder.count} queries"']
+        )
+
+        line = {
+            "method": request.method,
+            "path": request.path,
+            "view": getattr(request.resolver_match, "view_name", None),
+            "status": response.status_code,
+            "queries": recorder.count,
+            **{
+                f"{name}_ms": round(duration * 1000, 1)
+                for name, duration in timings.items()
+            },
+        }
+        if total * 1000 >= settings.REQUEST_TIMING_SLOW_MS:
+            line["statements"] = recorder.most_repeated(SLOW_REQUEST_STATEMENTS)
+            logger.warning(json.dumps(line))
+        else:
+            logger.info(json.dumps(line))
+        return response
+
+    def process_template_response(self, request, response):
+        # Template responses are rendered straight after the last of these hooks runs,
+        # and this middleware's runs last because it's first in MIDDLEWARE
+        started = time.perf_counter()
+
+        def record_render(response):
+            request._timing["render"] = time.perf_counter() - started
+
+        response.add_post_render_callback(record_render)
+        return response
+
+
+class ProfilingMiddleware:
+    """Profiles requests with the sampling profiler, saving them to PROFILING_DIR.
+
+    Staff can profile any request by adding ?profile to its URL or sending an
+    X-Profile header, and a PROFILING_SAMPLE_RATE fraction of all other requests are
+    profiled too. This must come after AuthenticationMiddleware. Unless PROFILING is
+    set it removes itself at startup, so costs nothing."""
+
+    def __init__(self, get_response):
+        if not settings.PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def should_profile(self, request):
+        if "profile" in request.GET or "X-Profile" in request.headers:
+            # Only checked when asked for, as loading the user costs a query
+            if request.user.is_staff:
+                return True
+        return random.random() < settings.PROFILING_SAMPLE_RATE
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+        started = time.perf_counter()
+        with profiling.Sampler(
+            threading.get_ident(), settings.PROFILING_INTERVAL_MS / 1000
+        ) as sampler:
+            response = self.get_response(request)
+        # Requests quicker than the interval have nothing worth keeping
+        if sampler.stacks:
+            profiling.save_profile(
+                sampler.stacks,
+                getattr(request.resolver_match, "view_name", None),
+                time.perf_counter() - started,
+            )
+        return response
+
+
+class MetricsMiddleware:
+    """Records how long each request takes, by the name of the URL pattern it matched"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        view_name = getattr(request.resolver_match, "view_name", None)
+        metrics.REQUEST_SECONDS.labels(
+            # Unmatched URLs are grouped together, so that scanners trying random
+            # paths can't create an unlimited number of series
+            view=view_name or "unmatched",
+            # Likewise any method can be sent, so unusual ones are grouped together
+            method=request.method if request.method in METRICS_METHODS else "other",
+        ).observe(time.perf_counter() - started)
+        return response
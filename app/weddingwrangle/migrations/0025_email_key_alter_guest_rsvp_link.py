@@ -0,0 +1,35 @@
+# Generated by Django 4.0.7 on 2026-10-19 12:46
+
+from django.db import migrations, models
+
+
+def key_rsvp_template(apps, schema_editor):
+    """The RSVP template was previously identified by its subject"""
+    Email = apps.get_model("weddingwrangle", "Email")
+    Email.objects.filter(subject="Thank you for RSVPing!").update(key="rsvp_thanks")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weddingwrangle', '0024_delete_dietaryother_guest_dietary_other'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='email',
+            name='key',
+            field=models.SlugField(blank=True, editable=False, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='guest',
+            name='dietary_other',
+            field=models.CharField(blank=True, max_length=1000, verbose_name='Dietaries (other)'),
+        ),
+        migrations.AlterField(
+            model_name='guest',
+            name='rsvp_link',
+            field=models.CharField(max_length=15, unique=True, verbose_name='RSVP Link'),
+        ),
+        migrations.RunPython(key_rsvp_template, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.0.7 on 2026-10-19 12:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weddingwrangle', '0026_queuedemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='audience',
+            name='dietaries',
+            field=models.ManyToManyField(blank=True, help_text='Virtual audiences only: guests with any of these dietaries', related_name='audience', to='weddingwrangle.dietary'),
+        ),
+        migrations.AddField(
+            model_name='audience',
+            name='has_email',
+            field=models.BooleanField(blank=True, help_text='Virtual audiences only: guests with or without an email address', null=True),
+        ),
+        migrations.AddField(
+            model_name='audience',
+            name='has_partner',
+            field=models.BooleanField(blank=True, help_text='Virtual audiences only: guests with or without a partner', null=True),
+        ),
+        migrations.AddField(
+            model_name='audience',
+            name='virtual',
+            field=models.BooleanField(default=False, help_text='Find members from the filter when emailing, rather than storing them'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weddingwrangle', '0027_virtual_audiences'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='guest',
+            index=models.Index(fields=['rsvp_status', 'rsvp_at'], name='guest_status_rsvp_at'),
+        ),
+        migrations.AddIndex(
+            model_name='guest',
+            index=models.Index(fields=['rsvp_status', 'created_at'], name='guest_status_created_at'),
+        ),
+        migrations.AddIndex(
+            model_name='guest',
+            index=models.Index(fields=['created_at'], name='guest_created_at'),
+        ),
+        migrations.AddIndex(
+            model_name='guest',
+            index=models.Index(fields=['updated_at'], name='guest_updated_at'),
+        ),
+        migrations.AddIndex(
+            model_name='guest',
+            index=models.Index(fields=['surname', 'first_name'], name='guest_name'),
+        ),
+    ]
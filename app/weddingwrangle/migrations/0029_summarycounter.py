@@ -0,0 +1,53 @@
+# Generated by Django 4.2.7 on 2026-10-19 13:27
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def count_guests(apps, schema_editor):
+    """Fill the counters from the existing guests, as counters.rebuild() would"""
+    Guest = apps.get_model("weddingwrangle", "Guest")
+    SummaryCounter = apps.get_model("weddingwrangle", "SummaryCounter")
+    GuestAudience = Guest.audiences.through
+    counts = {"guests": 0, "uncontactable": 0}
+    for rsvp_status_id, total, uncontactable in (
+        Guest.objects.order_by()
+        .values_list("rsvp_status_id")
+        .annotate(
+            total=Count("pk"), uncontactable=Count("pk", filter=Q(email_address=""))
+        )
+    ):
+        counts["guests"] += total
+        counts["uncontactable"] += uncontactable
+        counts[f"rsvp_status:{rsvp_status_id}"] = total
+    for audience_id, total, uncontactable in (
+        GuestAudience.objects.order_by()
+        .values_list("audience_id")
+        .annotate(
+            total=Count("pk"),
+            uncontactable=Count("pk", filter=Q(guest__email_address="")),
+        )
+    ):
+        counts[f"audience:{audience_id}"] = total
+        counts[f"audience:{audience_id}:uncontactable"] = uncontactable
+    SummaryCounter.objects.bulk_create(
+        [SummaryCounter(key=key, value=value) for key, value in counts.items()]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weddingwrangle', '0028_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SummaryCounter',
+            fields=[
+                ('key', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_guests, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import connections, models
 
 
 class Title(models.Model):
@@ -53,16 +53,126 @@ class Main(models.Model):
     def __str__(self):
         return self.name
 
+class AudienceQuerySet(models.QuerySet):
+    def with_sizes(self):
+        """Return the audiences with member_count, contactable_count and
+        uncontactable_count set. Stored audiences are read from their running totals
+        in one query, and virtual audiences counted together in one query of
+        conditional counts."""
+        audiences = list(self)
+
+        stored = [audience for audience in audiences if not audience.virtual]
+        if stored:
+            totals = SummaryCounter.objects.read(
+                *[SummaryCounter.audience_key(audience.pk) for audience in stored],
+                *[
+                    SummaryCounter.audience_key(audience.pk, uncontactable=True)
+                    for audience in stored
+                ],
+            )
+            for audience in stored:
+                audience.member_count = totals[SummaryCounter.audience_key(audience.pk)]
+                audience.contactable_count = audience.member_count - totals[
+                    SummaryCounter.audience_key(audience.pk, uncontactable=True)
+                ]
+
+        virtual = [audience for audience in audiences if audience.virtual]
+        if virtual:
+            models.prefetch_related_objects(
+                virtual, "positions", "rsvp_statuses", "dietaries"
+            )
+            counts = {}
+            for audience in virtual:
+                guest_filter = audience.guest_filter()
+                counts[f"members_{audience.pk}"] = models.Count(
+                    "pk", filter=guest_filter or None
+                )
+                counts[f"contactable_{audience.pk}"] = models.Count(
+                    "pk", filter=guest_filter & ~models.Q(email_address="")
+                )
+            totals = Guest.objects.aggregate(**counts)
+            for audience in virtual:
+                audience.member_count = totals[f"members_{audience.pk}"]
+                audience.contactable_count = totals[f"contactable_{audience.pk}"]
+
+        for audience in audiences:
+            audience.uncontactable_count = (
+                audience.member_count - audience.contactable_count
+            )
+        return audiences
+
+
 class Audience(models.Model):
     # M2M relationship with guests is defined within Guest class
     name = models.CharField(max_length=100)
     positions = models.ManyToManyField(Position, related_name="audience", blank=True)
     rsvp_statuses = models.ManyToManyField(RSVPStatus, related_name="audience", blank=True)
 
+    # Virtual audiences aren't stored against each guest; their members are found
+    # with the filter below whenever they're needed
+    virtual = models.BooleanField(
+        default=False,
+        help_text="Find members from the filter when emailing, rather than storing them",
+    )
+    dietaries = models.ManyToManyField(
+        Dietary,
+        related_name="audience",
+        blank=True,
+        help_text="Virtual audiences only: guests with any of these dietaries",
+    )
+    has_email = models.BooleanField(
+        null=True,
+        blank=True,
+        help_text="Virtual audiences only: guests with or without an email address",
+    )
+    has_partner = models.BooleanField(
+        null=True,
+        blank=True,
+        help_text="Virtual audiences only: guests with or without a partner",
+    )
+
+    objects = AudienceQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
+    def guest_filter(self):
+        """Compile the audience's filter into a Q object on guests. Empty choices and
+        unset flags don't restrict the audience."""
+        q = models.Q()
+        position_ids = [position.pk for position in self.positions.all()]
+        if position_ids:
+            q &= models.Q(position_id__in=position_ids)
+        rsvp_status_ids = [rsvp_status.pk for rsvp_status in self.rsvp_statuses.all()]
+        if rsvp_status_ids:
+            q &= models.Q(rsvp_status_id__in=rsvp_status_ids)
+        dietary_ids = [dietary.pk for dietary in self.dietaries.all()]
+        if dietary_ids:
+            # A subquery rather than a join, so guests with several matching
+            # dietaries only appear once
+            q &= models.Q(
+                pk__in=Guest.dietaries.through.objects.filter(
+                    dietary_id__in=dietary_ids
+                ).values("guest_id")
+            )
+        if self.has_email is not None:
+            q &= ~models.Q(email_address="") if self.has_email else models.Q(
+                email_address=""
+            )
+        if self.has_partner is not None:
+            q &= models.Q(partner__isnull=not self.has_partner)
+        return q
+
+    def members(self):
+        """Return the audience's guests as an unevaluated queryset"""
+        if self.virtual:
+            return Guest.objects.filter(self.guest_filter())
+        return self.guest.all()
+
 class Email(models.Model):
+    # Key of the template emailed to guests when they RSVP
+    RSVP_TEMPLATE_KEY = "rsvp_thanks"
+
     subject = models.CharField(max_length=100)
     text = models.CharField(max_length=10000000)
     date_sent = models.DateTimeField(auto_now=False, auto_now_add=False, null=True)
@@ -72,17 +182,73 @@ class Email(models.Model):
         related_name="email", 
         null=True
     )
+    # Stable key for emails the app sends itself, so they can be found even if their
+    # subject is edited
+    key = models.SlugField(unique=True, null=True, blank=True, editable=False)
 
     def __str__(self):
         return self.subject
 
 
+class QueuedEmail(models.Model):
+    """An email waiting to be sent by the send_queued_emails worker, so that requests
+    never wait on the mail server"""
+
+    subject = models.CharField(max_length=100)
+    message = models.TextField()
+    html_message = models.TextField(blank=True)
+    recipient = models.CharField(max_length=50)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # After a failed attempt, the email isn't tried again until then
+    next_attempt_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return self.subject + " to " + self.recipient
+
+    class Meta:
+        ordering = ["created_at"]
+
+
+class GuestQuerySet(models.QuerySet):
+    def with_related(self):
+        """Join the lookup tables shown in guest listings and prefetch dietaries, so
+        that rendering a list of guests costs a fixed number of queries"""
+        return self.select_related(
+            "title", "position", "rsvp_status", "partner", "starter", "main"
+        ).prefetch_related("dietaries")
+
+    def mark_sent(self, email):
+        """Record that the email was sent to these guests, with one INSERT ... SELECT
+        however many there are. Guests already marked are skipped."""
+        through = Guest.emails.through
+        sql, params = (
+            self.exclude(emails=email)
+            .annotate(email_id=models.Value(email.pk, models.BigIntegerField()))
+            .values_list("pk", "email_id")
+            .query.sql_with_params()
+        )
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO {} ({}, {}) {}".format(
+                    through._meta.db_table,
+                    through._meta.get_field("guest").column,
+                    through._meta.get_field("email").column,
+                    sql,
+                ),
+                params,
+            )
+            return cursor.rowcount
+
+
 class Guest(models.Model):
     # Unlinked fields
     first_name = models.CharField(max_length=30)
     surname = models.CharField(max_length=30)
     email_address = models.CharField(max_length=50, blank=True)
-    rsvp_link = models.CharField(max_length=15, verbose_name="RSVP Link")
+    rsvp_link = models.CharField(max_length=15, unique=True, verbose_name="RSVP Link")
     rsvp_qr = models.BinaryField(
         null=True, blank=True, editable=False, verbose_name="RSVP QR"
     )
@@ -134,5 +300,58 @@ class Guest(models.Model):
     # One-to-one field
     partner = models.OneToOneField("self", null=True, blank=True, on_delete=models.SET_NULL)
 
+    objects = GuestQuerySet.as_manager()
+
     def __str__(self):
         return self.first_name + " " + self.surname
+
+    class Meta:
+        indexes = [
+            # The home page chart counts each status's RSVPs and invitations by day
+            models.Index(fields=["rsvp_status", "rsvp_at"], name="guest_status_rsvp_at"),
+            models.Index(
+                fields=["rsvp_status", "created_at"], name="guest_status_created_at"
+            ),
+            # The chart starts from the first invitation, and the API's ETag comes
+            # from the latest change
+            models.Index(fields=["created_at"], name="guest_created_at"),
+            models.Index(fields=["updated_at"], name="guest_updated_at"),
+            # The importer finds partners by name, and the guest list sorts by it
+            models.Index(fields=["surname", "first_name"], name="guest_name"),
+        ]
+
+
+class SummaryCounterQuerySet(models.QuerySet):
+    def read(self, *keys):
+        """Return the values of these counters by key, in one query. Counters which
+        nothing has been counted towards yet are 0."""
+        values = dict(self.filter(key__in=keys).values_list("key", "value"))
+        return {key: values.get(key, 0) for key in keys}
+
+
+class SummaryCounter(models.Model):
+    """A running total of guests, kept up to date by weddingwrangle.counters so that
+    headline numbers are read rather than counted"""
+
+    # Keys of the counters of every guest, and of guests without an email address
+    GUESTS = "guests"
+    UNCONTACTABLE = "uncontactable"
+
+    key = models.CharField(max_length=50, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+    objects = SummaryCounterQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.key}: {self.value}"
+
+    @staticmethod
+    def rsvp_status_key(rsvp_status_id):
+        return f"rsvp_status:{rsvp_status_id}"
+
+    @staticmethod
+    def audience_key(audience_id, uncontactable=False):
+        """Key of the counter of an audience's stored members, or of those without an
+        email address"""
+        key = f"audience:{audience_id}"
+        return key + ":uncontactable" if uncontactable else key
@@ -0,0 +1,128 @@
+import logging
+import smtplib
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from weddingwrangle import metrics
+from weddingwrangle.models import QueuedEmail
+
+logger = logging.getLogger(__name__)
+
+# How long to wait before retrying an email after its first failed attempt, in
+# seconds. The wait doubles after each further failure, up to RETRY_MAX_SECONDS.
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 60 * 60
+
+# The mail server refusing a particular email. Any other error from the connection
+# (it couldn't be opened, dropped, timed out or wouldn't log in) is the server's
+# problem rather than the email's, so it isn't counted against the email.
+MESSAGE_ERRORS = (
+    smtplib.SMTPRecipientsRefused,
+    smtplib.SMTPSenderRefused,
+    smtplib.SMTPDataError,
+)
+
+
+class MailServerUnavailable(Exception):
+    """The mail server couldn't be reached, so nothing more can be sent for now"""
+
+
+def queue_email(subject, message, recipient, html_message=""):
+    """Queue an email to be sent by the worker once the current transaction commits,
+    so nothing is queued for changes which are rolled back"""
+    transaction.on_commit(
+        lambda: QueuedEmail.objects.create(
+            subject=subject,
+            message=message,
+            html_message=html_message,
+            recipient=recipient,
+        )
+    )
+
+
+def retry_delay(attempts):
+    """Return how long to wait before the next attempt after this many failures"""
+    return timedelta(
+        seconds=min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+    )
+
+
+def send_queued_emails(batch_size=50, max_attempts=10):
+    """Send a batch of the queued emails which are due, over a single connection to
+    the mail server. An email the server refuses is retried with exponential backoff
+    until max_attempts is reached. Returns the number of emails sent and failed.
+
+    Raises MailServerUnavailable if the server can't be reached, without counting an
+    attempt against any email, so that an outage doesn't use up their retries."""
+    now = timezone.now()
+    queued = list(
+        QueuedEmail.objects.filter(sent_at__isnull=True, attempts__lt=max_attempts)
+        .filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now))[
+            :batch_size
+        ]
+    )
+    if not queued:
+        return 0, 0
+
+    sent = failed = 0
+    connection = get_connection(fail_silently=False)
+    try:
+        try:
+            connection.open()
+        except OSError as e:
+            raise MailServerUnavailable(repr(e)) from e
+        for email in queued:
+            message = EmailMultiAlternatives(
+                email.subject,
+                email.message,
+                settings.FROM_EMAIL,
+                [email.recipient],
+                connection=connection,
+            )
+            if email.html_message:
+                message.attach_alternative(email.html_message, "text/html")
+            try:
+                with metrics.track_email_send():
+                    message.send()
+            except MESSAGE_ERRORS as e:
+                record_failure(email, e, max_attempts)
+                failed += 1
+                continue
+            except OSError as e:
+                # SMTP errors are OSErrors too, so this catches the connection
+                # failing as well as the network
+                raise MailServerUnavailable(repr(e)) from e
+            except Exception as e:
+                # Something wrong with the email itself, such as a bad address
+                record_failure(email, e, max_attempts)
+                failed += 1
+                continue
+            email.attempts += 1
+            email.sent_at = timezone.now()
+            email.last_error = ""
+            email.save(update_fields=["attempts", "last_error", "sent_at"])
+            sent += 1
+    finally:
+        try:
+            connection.close()
+        except OSError:
+            pass
+    return sent, failed
+
+
+def record_failure(email, error, max_attempts):
+    email.attempts += 1
+    email.last_error = repr(error)
+    email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+    email.save(update_fields=["attempts", "last_error", "next_attempt_at"])
+    if email.attempts >= max_attempts:
+        logger.error(
+            "Giving up on email %s to %s after %s attempts: %s",
+            email.pk,
+            email.recipient,
+            email.attempts,
+            email.last_error,
+        )
@@ -0,0 +1,165 @@
+"""A sampling profiler for requests, and the admin pages which show its profiles.
+
+While a request is profiled, a background thread records the request thread's call
+stack every PROFILING_INTERVAL_MS. That costs far less than tracing every call, so
+it's safe on a live server. The stacks are saved in the "folded" format (one
+"outer;inner;innermost count" line per distinct stack), which flamegraph.pl,
+speedscope and most other flame graph tools read directly.
+"""
+
+import os
+import re
+import sys
+import threading
+from collections import Counter
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, HttpResponse
+from django.shortcuts import render
+from django.utils import timezone
+
+# How many functions the summary page lists
+TOP_FUNCTIONS = 25
+
+PROFILE_NAME = re.compile(r"^[\w-]+\.folded$")
+
+
+def frame_label(frame):
+    code = frame.f_code
+    filename = "/".join(code.co_filename.split(os.sep)[-2:])
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+def fold(frame):
+    """Return a frame's call stack, outermost first, in the folded format"""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class Sampler:
+    """Samples one thread's call stack at a fixed interval until stopped"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[fold(frame)] += 1
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+
+def save_profile(stacks, view_name, duration):
+    """Save a profile, deleting the oldest ones beyond PROFILING_KEEP"""
+    os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+    name = "{}_{}_{}ms.folded".format(
+        timezone.now().strftime("%Y%m%d-%H%M%S-%f"),
+        re.sub(r"[^\w]+", "-", view_name or "unknown"),
+        round(duration * 1000),
+    )
+    with open(os.path.join(settings.PROFILING_DIR, name), "w") as file:
+        file.writelines(f"{stack} {count}\n" for stack, count in stacks.items())
+    for old_name in list_profiles()[settings.PROFILING_KEEP :]:
+        os.remove(os.path.join(settings.PROFILING_DIR, old_name))
+
+
+def list_profiles():
+    """Return the names of saved profiles, newest first"""
+    try:
+        names = os.listdir(settings.PROFILING_DIR)
+    except FileNotFoundError:
+        return []
+    return sorted((name for name in names if PROFILE_NAME.match(name)), reverse=True)
+
+
+def describe_profile(name):
+    """Split a profile's name into when it was taken, the view and its duration"""
+    taken, rest = name.removesuffix(".folded").split("_", 1)
+    view_name, duration = rest.rsplit("_", 1)
+    return {
+        "name": name,
+        "taken": taken,
+        "view_name": view_name,
+        "duration": duration,
+    }
+
+
+def load_profile(name):
+    if not PROFILE_NAME.match(name) or name not in list_profiles():
+        raise Http404("No such profile")
+    stacks = Counter()
+    with open(os.path.join(settings.PROFILING_DIR, name)) as file:
+        for line in file:
+            stack, count = line.rstrip("\n").rsplit(" ", 1)
+            stacks[stack] += int(count)
+    return stacks
+
+
+def summarise(stacks):
+    """Count the samples in which each function was running ("self") and in which it
+    was anywhere on the stack ("total")"""
+    own = Counter()
+    total = Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")
+        own[frames[-1]] += count
+        # A recursive function is only counted once per sample
+        for frame in set(frames):
+            total[frame] += count
+    return own.most_common(TOP_FUNCTIONS), total.most_common(TOP_FUNCTIONS)
+
+
+@staff_member_required
+def profile_list(request):
+    return render(
+        request,
+        "weddingwrangle/profile_list.html",
+        {
+            **admin.site.each_context(request),
+            "title": "Profiles",
+            "profiles": [describe_profile(name) for name in list_profiles()],
+        },
+    )
+
+
+@staff_member_required
+def profile_detail(request, name):
+    """Summarises a profile, or with ?download returns it in the folded format for a
+    flame graph tool"""
+    stacks = load_profile(name)
+    if "download" in request.GET:
+        response = HttpResponse(
+            "".join(f"{stack} {count}\n" for stack, count in stacks.items()),
+            content_type="text/plain",
+        )
+        response["Content-Disposition"] = f'attachment; filename="{name}"'
+        return response
+    own, total = summarise(stacks)
+    return render(
+        request,
+        "weddingwrangle/profile_detail.html",
+        {
+            **admin.site.each_context(request),
+            "title": f"Profile {name}",
+            "profile": describe_profile(name),
+            "samples": sum(stacks.values()),
+            "own": own,
+            "total": total,
+        },
+    )
@@ -0,0 +1,156 @@
+"""Query plans of the hot queries: the ones made on every RSVP, every load of the home
+page or every poll of the API, which would slow down as the guestlist grows if they
+read the whole of a table, or the whole of an index.
+
+Each hot query runs the code which makes it, and the plan of every statement it makes
+is taken from the database. The query plan tests (tests.py) check that they search
+an index for the rows they need, and the explain_hot_queries command prints them.
+"""
+
+import re
+from contextlib import contextmanager
+from typing import Callable, NamedTuple
+from django.db import connection, transaction
+from django.http import HttpRequest
+from weddingwrangle import api, views
+from weddingwrangle.models import Email, Guest
+
+
+class HotQuery(NamedTuple):
+    name: str
+    # The table which must be searched through an index
+    model: type
+    # Makes the query, given a sample guest
+    run: Callable
+    # A page of a sorted list has nothing to search for. Instead it must walk an index
+    # in the list's order, which stops at the end of the page, rather than sort.
+    ordered_page: bool = False
+
+
+HOT_QUERIES = (
+    HotQuery(
+        "rsvp_page",
+        Guest,
+        lambda guest: views.RSVPLinkMixin.queryset.get(rsvp_link=guest.rsvp_link),
+    ),
+    HotQuery("chart_replies", Guest, lambda guest: list(views.replies_by_day())),
+    HotQuery(
+        "chart_invitations", Guest, lambda guest: list(views.invitations_by_day())
+    ),
+    HotQuery("first_invitation", Guest, lambda guest: views.get_all_dates()),
+    HotQuery(
+        "latest_change", Guest, lambda guest: api.guest_list_state(HttpRequest())
+    ),
+    HotQuery(
+        "partner_by_name",
+        Guest,
+        lambda guest: Guest.objects.filter(
+            first_name=guest.first_name, surname=guest.surname
+        )[0],
+    ),
+    HotQuery(
+        "guest_list_by_surname",
+        Guest,
+        lambda guest: list(Guest.objects.order_by("surname", "first_name")[:25]),
+        ordered_page=True,
+    ),
+    HotQuery(
+        "rsvp_email_template",
+        Email,
+        lambda guest: Email.objects.get(key=Email.RSVP_TEMPLATE_KEY),
+    ),
+)
+
+
+@contextmanager
+def capturing_statements():
+    """Collect the SQL and parameters of every statement made inside the block"""
+    statements = []
+
+    def capture(execute, sql, params, many, context):
+        statements.append((sql, params))
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(capture):
+        yield statements
+
+
+def explain(sql, params):
+    """Return the lines of a statement's query plan"""
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(f"EXPLAIN {sql}", params)
+            return [row[0] for row in cursor.fetchall()]
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def hot_query_plans(hot_query, guest):
+    """Run a hot query, returning the plan of each statement it makes"""
+    with transaction.atomic():
+        if connection.vendor == "postgresql":
+            # Tiny tables are quicker to scan, so PostgreSQL would scan them whatever
+            # indexes there are
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+        with capturing_statements() as statements:
+            hot_query.run(guest)
+        return [explain(sql, params) for sql, params in statements]
+
+
+def plan_steps(plan):
+    """Split a PostgreSQL plan into its nodes, each a list of the node's line and the
+    lines of detail (such as its index condition) which follow it"""
+    steps = []
+    for line in plan:
+        line = line.strip()
+        if not steps or line.startswith("->"):
+            steps.append([line.removeprefix("->").strip()])
+        else:
+            steps[-1].append(line)
+    return steps
+
+
+def unindexed(plan, table, ordered_page=False):
+    """Return the steps of a query plan which read more of a table than they need:
+    those which scan it, rather than search an index for the rows they want (or, on
+    an ordered page, walk an index in order), and any sort of the page"""
+    found = []
+    if connection.vendor == "postgresql":
+        for node, *details in plan_steps(plan):
+            if ordered_page and re.match(r"(Incremental )?Sort\b", node):
+                found.append(node)
+            if not re.search(rf" on {table}\b", node):
+                continue
+            searched = re.match(
+                r"(Index (Only )?Scan|Bitmap Heap Scan) ", node
+            ) and any(
+                detail.startswith(("Index Cond:", "Recheck Cond:"))
+                for detail in details
+            )
+            walked = ordered_page and re.match(r"Index (Only )?Scan ", node)
+            if not (searched or walked):
+                found.append(node)
+        return found
+    # SQLite: "SEARCH table USING INDEX" looks rows up in an index, "SCAN table USING
+    # INDEX" reads every entry of one in order (so a LIMIT can stop it early) and
+    # "SCAN table" reads every row
+    for line in plan:
+        walked = ordered_page and " USING " in line
+        if re.match(rf"SCAN {table}\b", line) and not walked:
+            found.append(line)
+        if ordered_page and "TEMP B-TREE FOR ORDER BY" in line:
+            found.append(line)
+    return found
+
+
+def problems(hot_query, plans):
+    """Return what's wrong with the plans of a hot query's statements"""
+    table = hot_query.model._meta.db_table
+    if not any(table in line for plan in plans for line in plan):
+        return [f"no query on {table}"]
+    return [
+        step
+        for plan in plans
+        for step in unindexed(plan, table, hot_query.ordered_page)
+    ]
@@ -1,14 +1,15 @@
 import csv
 import random
 import string
+from django.db import transaction
 from weddingwrangle.models import (
     Title,
     Position,
     RSVPStatus,
     Dietary,
     Guest,
-    Audience,
 )
+from weddingwrangle import counters, metrics
 from weddingwrangle.scripts import sync
 
 
@@ -19,21 +20,23 @@ def generate_key():
                 string.ascii_uppercase + string.ascii_lowercase + string.digits, k=10
             )
         )
-        # Check randomness
-        try:
-            Guest.objects.get(rsvp_link=key)
-        except Guest.DoesNotExist:
+        # Check randomness against the unique index on rsvp_link
+        if not Guest.objects.filter(rsvp_link=key).exists():
             break
-        pass
     return key
 
 
+# The guestlist is replaced in one transaction, so the counters rebuilt at the end are
+# never seen out of step with it
+@transaction.atomic
 def csv_import_base(file_handler):
     partners = {}
     reader = csv.reader(file_handler)
     next(reader)  # Skip header row
 
-    Guest.objects.all().delete()
+    # Uncounting each guest would be wasted, as everything is counted again at the end
+    with counters.accounting_for(counters.ALL):
+        Guest.objects.all().delete()
 
     for row in reader:
         guest = Guest.objects.get_or_create(
@@ -46,10 +49,7 @@ def csv_import_base(file_handler):
             rsvp_link=generate_key(),
         )
 
-        guest[0].audiences.add(
-            Audience.objects.get(name="All potential guests (excludes Declined)")
-        )
-        guest[0].audiences.add(Audience.objects.get(name="All guests yet to RSVP"))
+        sync.sync_audience(guest[0])
 
         try:
             for dietary in row[9].split(","):
@@ -62,6 +62,7 @@ def csv_import_base(file_handler):
             partners[guest[0]] = {"First name": row[8], "Surname": row[9]}
 
         guest[0].save()
+        metrics.CSV_ROWS.labels(direction="import").inc()
 
     for guest, partner in partners.items():
         guest.partner = Guest.objects.filter(
@@ -69,6 +70,10 @@ def csv_import_base(file_handler):
         )[0]
         guest.save()
 
+    # Guests are created one by one without forms, so they're counted once they're
+    # all in
+    counters.rebuild()
+
 
 def run():
     file_handler = open("weddingwrangle/import_data.csv")
@@ -1,23 +1,10 @@
-from weddingwrangle.models import (
-    Guest,
-    Audience,
-)
+from weddingwrangle import audiences
+
 
 def sync_audience(guest):
-    """Add the guest to the relevant Audience."""
-    # Pick an appropriate audience
-    potential = Audience.objects.get(name="All potential guests (excludes Declined)")
-    no_response = Audience.objects.get(name="All guests yet to RSVP")
-    attending = Audience.objects.get(name="All attending guests")
-    guest.audiences.clear()
-    if guest.position.name != "Guest":
-        return guest
-    elif guest.rsvp_status.name == "Accepted":
-        guest.audiences.add(attending, potential)
-    elif guest.rsvp_status.name == "Declined":
-        guest.audiences.clear()
-    elif guest.rsvp_status.name == "Pending":
-        guest.audiences.add(no_response, potential)
+    """Add the guest to the audiences whose rules they match, and remove them from
+    the ones they no longer match. The guest must already be saved."""
+    audiences.sync_guest(guest)
     return guest
             
 def sync_partner(guest):
@@ -27,6 +14,4 @@ def sync_partner(guest):
     return guest
 
 def run():
-    for guest in Guest.objects.all(): 
-        guest = sync_audience(guest)
-        guest = sync_partner(guest)
+    audiences.resync_all()
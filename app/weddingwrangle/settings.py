@@ -55,11 +55,15 @@ INSTALLED_APPS = [
 CRISPY_TEMPLATE_PACK = "bootstrap3"
 
 MIDDLEWARE = [
+    "weddingwrangle.middleware.RequestTimingMiddleware",
+    "weddingwrangle.middleware.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "weddingwrangle.middleware.ProfilingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -78,24 +82,107 @@ TEMPLATES = [
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
                 "weddingwrangle.context_processors.app_name",
+                "weddingwrangle.context_processors.rsvp_events_url",
             ],
         },
     },
 ]
 
 WSGI_APPLICATION = "weddingwrangle.wsgi.application"
+ASGI_APPLICATION = "weddingwrangle.asgi.application"
+
+# Serve the public RSVP pages with async views. Only worthwhile under an ASGI server
+# (see docker-compose.asgi.yml): under WSGI each async view is run to completion in
+# the worker anyway.
+ASYNC_RSVP = bool(int(config("ASYNC_RSVP", default=0)))
 
 
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
-    }
+# 'DATABASE_ENGINE' should be 'sqlite' (the default) or 'postgresql'
+DATABASE_ENGINE = config("DATABASE_ENGINE", default="sqlite")
+
+# Each worker keeps its connection open for this many seconds rather than connecting
+# afresh for every request, checking that it's still usable before reusing it. Not
+# under ASYNC_RSVP, though: there database queries run in executor threads whose
+# persistent connections are never closed, so each thread would leak one (Django
+# ticket #33497). Connections are then closed after every request, and PostgreSQL
+# deployments should connect through a pooler such as PgBouncer instead.
+DATABASE_CONN_MAX_AGE = (
+    0 if ASYNC_RSVP else int(config("DATABASE_CONN_MAX_AGE", default=60))
+)
+
+# 'DATABASE_PROFILE' should be 'production' wherever more than one process shares
+# an SQLite database. WAL journaling lets readers carry on while somebody writes, and
+# write transactions queue for the lock (for up to 'SQLITE_BUSY_TIMEOUT' milliseconds)
+# rather than failing with "database is locked". WAL keeps '-wal' and '-shm' files
+# next to the database, so 'SQLITE_PATH' must be in a directory shared by every
+# process, not a bind-mounted file.
+DATABASE_PROFILE = config("DATABASE_PROFILE", default="development")
+SQLITE_BUSY_TIMEOUT = int(config("SQLITE_BUSY_TIMEOUT", default=20000))
+
+SQLITE_PROFILES = {
+    "development": {},
+    "production": {
+        "timeout": SQLITE_BUSY_TIMEOUT / 1000,
+        "transaction_mode": "IMMEDIATE",
+        "init_command": (
+            "PRAGMA journal_mode=WAL;"
+            "PRAGMA synchronous=NORMAL;"
+            f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT};"
+            # Negative cache sizes are in KiB, so this is 64MiB
+            "PRAGMA cache_size=-65536;"
+            "PRAGMA mmap_size=268435456;"
+            "PRAGMA temp_store=MEMORY;"
+        ),
+    },
 }
 
+# Queries running longer than 'DATABASE_STATEMENT_TIMEOUT' milliseconds are cancelled
+# by PostgreSQL, as are transactions left idle for 'DATABASE_IDLE_TIMEOUT'
+DATABASE_STATEMENT_TIMEOUT = int(config("DATABASE_STATEMENT_TIMEOUT", default=10000))
+DATABASE_IDLE_TIMEOUT = int(config("DATABASE_IDLE_TIMEOUT", default=60000))
+
+if DATABASE_ENGINE == "postgresql":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": config("DATABASE_NAME", default="weddingwrangle"),
+            "USER": config("DATABASE_USER", default="weddingwrangle"),
+            "PASSWORD": config("DATABASE_PASSWORD", default=""),
+            "HOST": config("DATABASE_HOST", default="localhost"),
+            "PORT": config("DATABASE_PORT", default="5432"),
+            "CONN_MAX_AGE": DATABASE_CONN_MAX_AGE,
+            "CONN_HEALTH_CHECKS": True,
+            # Set 'DATABASE_POOLER=1' when connecting through a transaction-pooling
+            # PgBouncer, which can't hold server-side cursors open between queries
+            "DISABLE_SERVER_SIDE_CURSORS": bool(
+                int(config("DATABASE_POOLER", default=0))
+            ),
+            "OPTIONS": {
+                "connect_timeout": int(config("DATABASE_CONNECT_TIMEOUT", default=5)),
+            },
+        }
+    }
+    # PgBouncer doesn't pass startup options on, so behind it the timeouts have to be
+    # set on the PostgreSQL server instead
+    if not DATABASES["default"]["DISABLE_SERVER_SIDE_CURSORS"]:
+        DATABASES["default"]["OPTIONS"]["options"] = (
+            f"-c statement_timeout={DATABASE_STATEMENT_TIMEOUT} "
+            f"-c idle_in_transaction_session_timeout={DATABASE_IDLE_TIMEOUT}"
+        )
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "weddingwrangle.backends.sqlite3",
+            "NAME": config("SQLITE_PATH", default=str(BASE_DIR / "db.sqlite3")),
+            "CONN_MAX_AGE": DATABASE_CONN_MAX_AGE,
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": SQLITE_PROFILES[DATABASE_PROFILE],
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -132,8 +219,22 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/4.0/howto/static-files/
 
 STATIC_URL = "static/"
-# STATIC_ROOT = BASE_DIR / "static"
-STATIC_ROOT = BASE_DIR / "weddingwrangle/static/"
+# Where collectstatic gathers the app's own files from 'weddingwrangle/static/' and
+# those of Django's admin and the other installed apps
+STATIC_ROOT = BASE_DIR / "staticfiles"
+
+# collectstatic names each file after a hash of its contents and writes gzip and brotli
+# copies alongside it. WhiteNoise then serves them straight from the app, picking the
+# smallest copy the browser accepts. Hashed names change whenever a file does, so
+# browsers are told to cache them forever without checking back.
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
+    },
+}
 
 # SSL
 
@@ -164,5 +265,129 @@ EMAIL_HOST_USER = config("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = config("EMAIL_HOST_PASSWORD")
 FROM_EMAIL = "wedding@willthong.com"
 
+# Caching
+# With 'CACHE_BACKEND=sqlite', every process shares one cache in the SQLite file at
+# 'CACHE_PATH' rather than each keeping its own in memory, and it survives restarts.
+# Entries are evicted, least recently used first, once there are more than
+# 'CACHE_MAX_ENTRIES' or their values take up more than 'CACHE_MAX_SIZE' bytes.
+CACHE_BACKEND = config("CACHE_BACKEND", default="locmem")
+CACHE_PATH = config("CACHE_PATH", default=str(BASE_DIR / "cache.sqlite3"))
+CACHE_MAX_ENTRIES = int(config("CACHE_MAX_ENTRIES", default=10000))
+CACHE_MAX_SIZE = int(config("CACHE_MAX_SIZE", default=64 * 1024 * 1024))
+
+
+def cache_settings(name):
+    """Settings for a cache, called name, of the configured 'CACHE_BACKEND'"""
+    if CACHE_BACKEND == "sqlite":
+        return {
+            "BACKEND": "weddingwrangle.backends.sqlite_cache.SQLiteCache",
+            "LOCATION": CACHE_PATH,
+            "OPTIONS": {
+                "MAX_ENTRIES": CACHE_MAX_ENTRIES,
+                "MAX_SIZE": CACHE_MAX_SIZE,
+                "TABLE": name,
+            },
+        }
+    return {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": name,
+        "OPTIONS": {"MAX_ENTRIES": CACHE_MAX_ENTRIES},
+    }
+
+
+CACHES = {
+    "default": cache_settings("default"),
+    # Used by {% cache %} tags, so that rendered fragments can't evict the app's data
+    "template_fragments": cache_settings("template_fragments"),
+}
+
+# Sessions and users
+# With 'SESSION_MODE=cached_db' (the default), sessions are read from the cache and
+# only from the database when they've been evicted. 'signed_cookies' keeps them in
+# the browser instead, so there's no session table at all, but logging out then can't
+# end a session stolen before it. 'db' always reads the database.
+SESSION_MODE = config("SESSION_MODE", default="cached_db")
+SESSION_ENGINE = {
+    "db": "django.contrib.sessions.backends.db",
+    "cached_db": "django.contrib.sessions.backends.cached_db",
+    "signed_cookies": "django.contrib.sessions.backends.signed_cookies",
+}[SESSION_MODE]
+
+# Logged in users are loaded from the cache too, so that organisers' pages needn't
+# query the database before they do anything else
+AUTHENTICATION_BACKENDS = ["weddingwrangle.backends.auth.CachedModelBackend"]
+USER_CACHE_SECONDS = int(config("USER_CACHE_SECONDS", default=60 * 60))
+
+# How long public pages, such as the wedding details and RSVP pages, are cached for
+PAGE_CACHE_SECONDS = int(config("PAGE_CACHE_SECONDS", default=60 * 60))
+# How long the home page chart is cached for. Saving a guest refreshes it anyway.
+CHART_CACHE_SECONDS = int(config("CHART_CACHE_SECONDS", default=60 * 60))
+
+# Live dashboard updates
+# RSVPs are appended to this file as they're saved and streamed to open dashboards.
+# Like 'SQLITE_PATH', it must be somewhere shared by every process. It's started afresh
+# once it reaches 'RSVP_EVENTS_MAX_BYTES'.
+RSVP_EVENTS_PATH = config(
+    "RSVP_EVENTS_PATH", default=str(BASE_DIR / "rsvp_events.jsonl")
+)
+RSVP_EVENTS_MAX_BYTES = int(config("RSVP_EVENTS_MAX_BYTES", default=1024 * 1024))
+# Each stream is closed after this many seconds and the browser reconnects. Under sync
+# workers every open dashboard would occupy a whole worker while streaming, so live
+# updates are off (0) unless the app is served with ASYNC_RSVP=1.
+RSVP_EVENTS_STREAM_SECONDS = int(
+    config("RSVP_EVENTS_STREAM_SECONDS", default=5 * 60 if ASYNC_RSVP else 0)
+)
+
+# Request timing
+# Adds a Server-Timing header to every response, and logs each request's query, render
+# and view times. Requests taking at least 'REQUEST_TIMING_SLOW_MS' are logged as
+# warnings along with their most repeated SQL. The header is visible to anyone, so only
+# turn this on while investigating.
+REQUEST_TIMING = bool(int(config("REQUEST_TIMING", default=0)))
+REQUEST_TIMING_SLOW_MS = int(config("REQUEST_TIMING_SLOW_MS", default=500))
+
+# Profiling
+# Staff can profile a request by adding '?profile' to its URL or sending an 'X-Profile'
+# header, and a 'PROFILING_SAMPLE_RATE' fraction (e.g. 0.01) of all requests are
+# profiled too. The profiler records the call stack every 'PROFILING_INTERVAL_MS', so it
+# slows requests very little. The newest 'PROFILING_KEEP' profiles are kept, and can be
+# viewed at /admin/profiles/.
+PROFILING = bool(int(config("PROFILING", default=0)))
+PROFILING_SAMPLE_RATE = float(config("PROFILING_SAMPLE_RATE", default=0))
+PROFILING_INTERVAL_MS = float(config("PROFILING_INTERVAL_MS", default=5))
+PROFILING_DIR = config("PROFILING_DIR", default=str(BASE_DIR / "profiles"))
+PROFILING_KEEP = int(config("PROFILING_KEEP", default=100))
+
+# Metrics
+# Served at /metrics for Prometheus to requests from this host and to staff users.
+# Set 'METRICS_TOKEN' to let Prometheus in from elsewhere by sending it as a bearer
+# token, or 'METRICS_PUBLIC=1' to serve them to anyone. To add up the metrics of every
+# gunicorn worker, set the PROMETHEUS_MULTIPROC_DIR environment variable to a
+# directory shared by every process (see weddingwrangle/metrics.py). Processes
+# outside gunicorn, such as the mailer, use directories of their own, which
+# 'METRICS_OTHER_DIRS' lists (separated by commas).
+METRICS_TOKEN = config("METRICS_TOKEN", default="")
+METRICS_PUBLIC = bool(int(config("METRICS_PUBLIC", default=0)))
+METRICS_OTHER_DIRS = [
+    directory
+    for directory in config("METRICS_OTHER_DIRS", default="").split(",")
+    if directory
+]
+
+# Logging
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "weddingwrangle": {
+            "handlers": ["console"],
+            "level": config("LOG_LEVEL", default="INFO"),
+        },
+    },
+}
+
 # QR Code settings
 SERVE_QR_CODE_IMAGE_PATH = "qr-code-image/"
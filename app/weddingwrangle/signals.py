@@ -0,0 +1,81 @@
+from django.contrib.auth.models import Group, User
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from weddingwrangle import caching, counters
+from weddingwrangle.models import Audience, Email, Guest, RSVPStatus, SummaryCounter
+
+
+@receiver([post_save, post_delete], sender=Email)
+def email_changed(sender, instance, **kwargs):
+    if instance.key == Email.RSVP_TEMPLATE_KEY:
+        caching.invalidate_rsvp_email_template()
+
+
+@receiver([post_save, post_delete], sender=Guest)
+def guest_changed(sender, instance, **kwargs):
+    # The thank you page also shows the guest's partner, so refresh theirs too
+    rsvp_links = [instance.rsvp_link]
+    if instance.partner_id is not None:
+        rsvp_links += Guest.objects.filter(pk=instance.partner_id).values_list(
+            "rsvp_link", flat=True
+        )
+    caching.invalidate_guests(*rsvp_links)
+
+
+def reference_data_changed(sender, **kwargs):
+    caching.invalidate_reference_data()
+
+
+for model in caching.REFERENCE_MODELS + (Audience,):
+    post_save.connect(reference_data_changed, sender=model)
+    post_delete.connect(reference_data_changed, sender=model)
+
+# Audience rules are compiled from these relationships and cached with the reference data
+m2m_changed.connect(reference_data_changed, sender=Audience.positions.through)
+m2m_changed.connect(reference_data_changed, sender=Audience.rsvp_statuses.through)
+
+
+@receiver(post_delete, sender=Audience)
+def audience_deleted(sender, instance, **kwargs):
+    counters.forget(
+        SummaryCounter.audience_key(instance.pk),
+        SummaryCounter.audience_key(instance.pk, uncontactable=True),
+    )
+
+
+@receiver(post_delete, sender=RSVPStatus)
+def rsvp_status_deleted(sender, instance, **kwargs):
+    # Its guests were deleted (and uncounted) along with it
+    counters.forget(SummaryCounter.rsvp_status_key(instance.pk))
+
+
+@receiver(pre_delete, sender=Guest)
+def guest_deleting(sender, instance, **kwargs):
+    # Deleting a title, position, main course or RSVP status deletes its guests too
+    counters.uncount(instance)
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    caching.invalidate_user(instance.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def user_permissions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        user_ids = [instance.pk]
+    elif action == "pre_clear":
+        # Clearing a group's or permission's users doesn't say who they were
+        user_ids = instance.user_set.values_list("pk", flat=True)
+    else:
+        user_ids = pk_set or []
+    for user_id in user_ids:
+        caching.invalidate_user(user_id)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def group_permissions_changed(sender, instance, reverse, pk_set, **kwargs):
+    groups = Group.objects.filter(pk__in=pk_set or []) if reverse else [instance]
+    for user_id in User.objects.filter(groups__in=groups).values_list("pk", flat=True):
+        caching.invalidate_user(user_id)
@@ -0,0 +1,17 @@
+// Search guests as the user types in selects rendered by GuestSearchSelect
+$(function () {
+  $("select.guest-search").each(function () {
+    const select = $(this);
+    select.select2({
+      width: "100%",
+      allowClear: true,
+      placeholder: "",
+      ajax: {
+        url: select.data("search-url"),
+        dataType: "json",
+        delay: 250,
+        data: (params) => ({ term: params.term, page: params.page }),
+      },
+    });
+  });
+});
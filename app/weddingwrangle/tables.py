@@ -2,7 +2,6 @@ import django_tables2
 from weddingwrangle.models import Guest
 from django.urls import reverse
 from django.utils.safestring import mark_safe
-from weddingwrangle import views
 
 def convert_to_url(self, value):
     url = reverse("guest_update", args=[value])
@@ -11,7 +10,10 @@ def convert_to_url(self, value):
 
 class GuestTable(django_tables2.Table):
     pk = django_tables2.Column(verbose_name="ID")
-    rsvp_status = django_tables2.Column(verbose_name="RSVP")
+    # Marked so that live RSVP updates can find the cell to change
+    rsvp_status = django_tables2.Column(
+        verbose_name="RSVP", attrs={"td": {"data-column": "rsvp_status"}}
+    )
     email_address = django_tables2.Column(orderable=False)
 
     class Meta:
@@ -27,6 +29,7 @@ class GuestTable(django_tables2.Table):
             "partner",
             "dietaries",
         )
+        row_attrs = {"data-guest": lambda record: record.pk}
     
     def render_pk(self, value):
         return convert_to_url(self, value)
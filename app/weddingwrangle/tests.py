@@ -0,0 +1,44 @@
+from django.test import TransactionTestCase
+from weddingwrangle import benchmarks, query_plans
+from weddingwrangle.models import Guest
+
+
+# Not TestCase: its transaction around each test would turn every atomic block in
+# the views into extra SAVEPOINT queries, which they don't make when served
+class QueryBudgetTests(TransactionTestCase):
+    """Each view with a query budget stays within it, and makes the same queries for
+    a small guestlist as a large one, so that a query per guest can't creep in"""
+
+    sizes = (10, 1000)
+
+    def test_query_budgets(self):
+        recorders = benchmarks.count_budget_queries(self.sizes, new_database=False)
+        for view in benchmarks.QUERY_BUDGETS:
+            counts = [recorders[view.name][size].count for size in self.sizes]
+            # The largest guestlist's queries show any repetition most clearly
+            repeated = "\n".join(
+                f"{statement['count']} x {statement['sql'][:300]}"
+                for statement in recorders[view.name][max(self.sizes)].most_repeated(3)
+            )
+            with self.subTest(view=view.name):
+                self.assertLessEqual(max(counts), view.budget, repeated)
+                self.assertEqual(counts[0], counts[-1], repeated)
+
+
+class HotQueryPlanTests(TransactionTestCase):
+    """The queries made on every RSVP, home page load or API poll search an index for
+    the rows they need, rather than reading all of a table or all of an index"""
+
+    guests = 1000
+
+    def test_hot_queries_search_an_index(self):
+        for _, context in benchmarks.guestlists([self.guests], new_database=False):
+            guest = Guest.objects.filter(partner__isnull=False).first()
+            for hot_query in query_plans.HOT_QUERIES:
+                plans = query_plans.hot_query_plans(hot_query, guest)
+                with self.subTest(query=hot_query.name):
+                    self.assertEqual(
+                        query_plans.problems(hot_query, plans),
+                        [],
+                        "\n\n".join("\n".join(plan) for plan in plans),
+                    )
@@ -16,26 +16,47 @@ Including another URLconf
 
 from django.contrib import admin
 from django.urls import path, include, reverse_lazy
-from . import views
+from . import api, metrics, profiling, views
 from django.conf import settings
 from django.contrib.auth.views import LogoutView
+from django.views.decorators.cache import cache_page
 from django.views.generic import TemplateView
 
+if settings.ASYNC_RSVP:
+    from .async_views import (
+        AsyncRSVPView as RSVPView,
+        AsyncRSVPThank as RSVPThank,
+        AsyncRSVPPartner as RSVPPartner,
+        async_rsvp_events as rsvp_events,
+    )
+else:
+    from .views import RSVPView, RSVPThank, RSVPPartner, rsvp_events
+
 app_name = "weddingwrangle"
 urlpatterns = [
+    # Before the admin site, whose catch-all pattern would otherwise match these
+    path("admin/profiles/", profiling.profile_list, name="profile_list"),
+    path(
+        "admin/profiles/<str:name>/",
+        profiling.profile_detail,
+        name="profile_detail",
+    ),
     path("admin/", admin.site.urls),
     path("", views.HomePage.as_view(), name="home"),
+    path("events/rsvps/", rsvp_events, name="rsvp_events"),
     path("guests/", views.GuestList.as_view(), name="guest_list"),
     path("guests/create/", views.GuestCreate.as_view(), name="guest_create"),
     path("guests/export/csv/", views.export_csv, name="guest_export_csv"),
     path("guests/export/qr/", views.export_qr, name="guest_export_qr"),
     path("guests/upload/", views.GuestUpload.as_view(), name="guest_upload"),
+    path("guests/search/", views.GuestSearch.as_view(), name="guest_search"),
     path(
         "guests/<int:pk>/update/",
         views.GuestUpdate.as_view(success_url=reverse_lazy("guest_list")),
         name="guest_update",
     ),
     path("guests/<int:pk>/delete/", views.GuestDelete.as_view(), name="guest_delete"),
+    path("api/v1/guests/", api.guest_list, name="api_guest_list"),
     path("email/", views.EmailList.as_view(), name="email_create"),
     path(
         "email/rsvp_template/",
@@ -55,29 +76,34 @@ urlpatterns = [
     path("qr_code/", include("qr_code.urls", namespace="qr_code"), name="qr_urls"),
     path(
         "rsvp/thankyou/",
-        TemplateView.as_view(template_name="weddingwrangle/rsvp_thank_partner.html"),
+        cache_page(settings.PAGE_CACHE_SECONDS)(
+            TemplateView.as_view(template_name="weddingwrangle/rsvp_thank_partner.html")
+        ),
         name="rsvp_thank_partner",
     ),
     path(
         "rsvp/<str:rsvp_link>/",
-        views.RSVPView.as_view(success_url=reverse_lazy("rsvp_thank")),
+        RSVPView.as_view(),
         name="rsvp",
     ),
     path(
         "rsvp/<str:rsvp_link>/thanks/",
-        views.RSVPThank.as_view(),
+        RSVPThank.as_view(),
         name="rsvp_thank",
     ),
     path(
         "rsvp/<str:rsvp_link>/partner/",
-        views.RSVPPartner.as_view(),
+        RSVPPartner.as_view(),
         name="rsvp_partner",
     ),
     path(
         "details/", 
-        TemplateView.as_view(template_name="weddingwrangle/wedding_details.html"),
+        cache_page(settings.PAGE_CACHE_SECONDS)(
+            TemplateView.as_view(template_name="weddingwrangle/wedding_details.html")
+        ),
         name="details",
     ),
+    path("metrics", metrics.metrics_view, name="metrics"),
     path("accounts/", include("django.contrib.auth.urls")),
     # https://stackoverflow.com/a/63445257/3161714
     path(
@@ -2,17 +2,22 @@ import csv
 from datetime import timedelta, datetime, date
 from io import StringIO
 import os, shutil
-from plotly.offline import plot
-import plotly.graph_objs as graph_objs
 import re
 from typing import NamedTuple
 from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required
 from django.contrib.sites.shortcuts import get_current_site
+from django.core.cache import cache
 from django.core.mail import send_mail
-from django.db.models import Min
-from django.http import HttpResponseRedirect, HttpResponse
+from django.db.models import Count, Min, Q
+from django.db.models.functions import TruncDate
+from django.http import (
+    HttpResponseRedirect,
+    HttpResponse,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import render
 from django_tables2 import SingleTableView
 from django.template.loader import render_to_string
@@ -30,21 +35,77 @@ from weddingwrangle.forms import (
     RSVPEmailTemplate,
     CSVForm,
 )
-from weddingwrangle.models import Guest, Email
+from weddingwrangle import caching, counters, events, metrics, outbox
+from weddingwrangle.models import Guest, Email, RSVPStatus
 from weddingwrangle.tables import GuestTable
-from qr_code.qrcode.serve import make_qr_code_url
-from qr_code.qrcode.maker import QRCodeOptions, make_qr_code_image
 from weddingwrangle.scripts import csv_import
 
 
 class GuestList(LoginRequiredMixin, SingleTableView):
     model = Guest
+    queryset = Guest.objects.with_related()
     table_class = GuestTable
     template_name = "guest_list.html"
 
 
-class RSVPView(UpdateView):
+class RSVPLinkMixin:
+    """Resolves the guest from the RSVP link captured by the URL dispatcher with a
+    single lookup on the indexed rsvp_link column, joining the lookup tables which the
+    RSVP pages display. Unknown links are a 404 rather than a server error."""
+
     model = Guest
+    queryset = Guest.objects.select_related(
+        "title", "rsvp_status", "starter", "main", "partner__title"
+    )
+    slug_field = "rsvp_link"
+    slug_url_kwarg = "rsvp_link"
+
+
+class GuestPageCacheMixin:
+    """Caches the rendered GET response per RSVP link and CSRF cookie. Saving the
+    guest invalidates every cached page for their link."""
+
+    def get(self, request, *args, **kwargs):
+        key = caching.get_guest_page_key(request, self.kwargs["rsvp_link"])
+        if key is None:
+            return super().get(request, *args, **kwargs)
+        content = cache.get(key)
+        if content is not None:
+            return HttpResponse(content)
+        response = super().get(request, *args, **kwargs)
+        response.add_post_render_callback(
+            lambda response: cache.set(
+                key, response.content, settings.PAGE_CACHE_SECONDS
+            )
+        )
+        return response
+
+
+def queue_rsvp_confirmation(guest, dietaries):
+    """Queue the RSVP template email to a guest who has just RSVPed, if they have an
+    email address"""
+    if not guest.email_address:
+        return
+    email_object = caching.get_rsvp_email_template()
+    merged_message, rendered_message = generate_message(
+        email_object,
+        first_name=guest.first_name,
+        rsvp_status=guest.rsvp_status,
+        starter=guest.starter,
+        main=guest.main,
+        dietaries="; ".join([dietary.name for dietary in dietaries]),
+    )
+    # Sent by the send_queued_emails worker, so that the guest isn't kept waiting on
+    # the mail server and an outage can't fail their RSVP
+    outbox.queue_email(
+        email_object.subject,
+        message=merged_message,
+        recipient=guest.email_address,
+        html_message=rendered_message,
+    )
+
+
+class RSVPView(GuestPageCacheMixin, RSVPLinkMixin, UpdateView):
     form_class = RSVPForm
     template_name = "weddingwrangle/rsvp.html"
 
@@ -53,58 +114,23 @@ class RSVPView(UpdateView):
         url = reverse_lazy("rsvp_thank", args=[self.object.rsvp_link])
         return url
 
-    # Overriding get_object so that the RSVP link captured by the URL dispatcher is used
-    # to find the object. self.kwargs is a dictionary containing captured URL parameters.
-    def get_object(self):
-        return self.model.objects.get(rsvp_link=self.kwargs["rsvp_link"])
-
     def form_valid(self, form):
         response = super().form_valid(form)
-        guest = Guest.objects.get(rsvp_link=self.kwargs["rsvp_link"])
-        if guest.email_address:
-            email_object = Email.objects.get(subject="Thank you for RSVPing!")
-            merged_message, rendered_message = generate_message(
-                email_object,
-                first_name=guest.first_name,
-                rsvp_status=guest.rsvp_status,
-                starter=guest.starter,
-                main=guest.main,
-                dietaries = "; ".join(
-                    [dietary.name for dietary in list(guest.dietaries.all())]
-                )
-            )
-            # https://docs.djangoproject.com/en/4.2/topics/email/
-            send_mail(
-                "Thank you for RSVPing!",
-                message=merged_message,
-                from_email=settings.FROM_EMAIL,
-                recipient_list=[guest.email_address],
-                fail_silently=False,
-                html_message=rendered_message,
-            )
-
+        # The guest looked up for this request has just been saved by the form, so it
+        # can be reused rather than fetched again
+        queue_rsvp_confirmation(self.object, form.cleaned_data["dietaries"])
         return response
 
 
-class RSVPThank(DetailView):
-    model = Guest
+class RSVPThank(GuestPageCacheMixin, RSVPLinkMixin, DetailView):
     template_name = "weddingwrangle/rsvp_thanks.html"
 
-    def get_object(self):
-        return self.model.objects.get(rsvp_link=self.kwargs["rsvp_link"])
-
 
-class RSVPPartner(UpdateView):
-    model = Guest
+class RSVPPartner(GuestPageCacheMixin, RSVPLinkMixin, UpdateView):
     form_class = RSVPForm
     success_url = reverse_lazy("rsvp_thank_partner")
     template_name = "weddingwrangle/rsvp_partner.html"
 
-    # Overriding get_object so that the RSVP link captured by the URL dispatcher is used
-    # to find the object. self.kwargs is a dictionary containing captured URL parameters.
-    def get_object(self):
-        return self.model.objects.get(rsvp_link=self.kwargs["rsvp_link"])
-
 
 class GuestCreate(LoginRequiredMixin, CreateView):
     model = Guest
@@ -121,7 +147,7 @@ class GuestUpdate(LoginRequiredMixin, UpdateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        rsvp_link = self.get_object().rsvp_link
+        rsvp_link = self.object.rsvp_link
         context["qr_url"] = self.request.build_absolute_uri(
             reverse("rsvp", args=[rsvp_link])
         )
@@ -133,42 +159,134 @@ class GuestDelete(LoginRequiredMixin, DeleteView):
     template_name_suffix = "_delete"
     success_url = reverse_lazy("guest_list")
 
+    def form_valid(self, form):
+        with counters.track(self.object):
+            return super().form_valid(form)
+
+
+class GuestSearch(LoginRequiredMixin, View):
+    """Find guests by name or email address for the partner field on the guest forms,
+    a page at a time, in the format its select widget expects"""
+
+    page_size = 20
+
+    def get(self, request):
+        guests = Guest.objects.order_by("surname", "first_name", "pk")
+        for word in request.GET.get("term", "").split():
+            guests = guests.filter(
+                Q(first_name__icontains=word)
+                | Q(surname__icontains=word)
+                | Q(email_address__icontains=word)
+            )
+        try:
+            page = max(int(request.GET.get("page", 1)), 1)
+        except ValueError:
+            page = 1
+        start = (page - 1) * self.page_size
+        # One more than a page, to tell whether there's another after it
+        found = list(
+            guests.values_list("pk", "first_name", "surname")[
+                start : start + self.page_size + 1
+            ]
+        )
+        return JsonResponse(
+            {
+                "results": [
+                    {"id": pk, "text": first_name + " " + surname}
+                    for pk, first_name, surname in found[: self.page_size]
+                ],
+                "pagination": {"more": len(found) > self.page_size},
+            }
+        )
+
 
 # Cleaner date generation with list comprehension
 def get_all_dates():
     start_date = Guest.objects.aggregate(Min("created_at"))["created_at__min"]
+    if start_date is None:
+        return []
     days = (timezone.now() - start_date).days
     return [start_date + timedelta(days=day) for day in range(0, days + 1)]
 
 
-# Load stats from database for a given date.
-def load_attending_stats(date):
-    # Defining a named tuple rather than multiple lists
-    class AttendingStats(NamedTuple):
-        date: date
-        attending: int
-        declined: int
-        pending: int
-        total: int
-
-    # Uses less than / equal to (lte) rather than previous approach of incrementing query_date
-    attending = (
-        Guest.objects.filter(rsvp_at__lte=date)
-        .filter(rsvp_status__name="Accepted")
-        .count()
+class AttendingStats(NamedTuple):
+    date: date
+    attending: int
+    declined: int
+    pending: int
+    total: int
+
+
+def count_by_day(guests, field, group_by=()):
+    """Count guests by the day of a date field (and any other fields), returning rows
+    of the day, the group_by values and the count"""
+    return (
+        guests.exclude(**{f"{field}__isnull": True})
+        .annotate(day=TruncDate(field))
+        .values("day", *group_by)
+        .annotate(count=Count("pk"))
+        .order_by()
     )
-    declined = (
-        Guest.objects.filter(rsvp_at__lte=date)
-        .filter(rsvp_status__name="Declined")
-        .count()
+
+
+def rsvp_status_ids(*names):
+    """Look up the RSVP statuses by name from the cached reference data, so that the
+    chart's queries filter on the guests' own rsvp_status column, which leads its
+    indexes, rather than on a join"""
+    return [
+        status.pk
+        for status in caching.get_reference_objects(RSVPStatus)
+        if status.name in names
+    ]
+
+
+def replies_by_day():
+    return count_by_day(
+        Guest.objects.filter(rsvp_status__in=rsvp_status_ids("Accepted", "Declined")),
+        "rsvp_at",
+        ["rsvp_status__name"],
     )
-    pending = (
-        Guest.objects.filter(created_at__lte=date)
-        .filter(rsvp_status__name="Pending")
-        .count()
+
+
+def invitations_by_day():
+    return count_by_day(
+        Guest.objects.filter(rsvp_status__in=rsvp_status_ids("Pending")), "created_at"
     )
-    total = attending + declined + pending
-    return AttendingStats(date, attending, declined, pending, total)
+
+
+def load_attending_stats(dates):
+    """Load the stats for every date with two grouped queries, counting the RSVPs and
+    invitations on each day and adding them up, rather than counting again for each
+    date. Each date counts everything up to the end of its day in local time, so the
+    last one includes every RSVP made today."""
+    stats = []
+    totals = {"Accepted": 0, "Declined": 0, "Pending": 0}
+    # Each count is added in once the chart reaches its day
+    counts = sorted(
+        [
+            (row["day"], row["rsvp_status__name"], row["count"])
+            for row in replies_by_day()
+        ]
+        + [(row["day"], "Pending", row["count"]) for row in invitations_by_day()],
+        key=lambda item: item[0],
+    )
+    position = 0
+    for date in dates:
+        day = timezone.localtime(date).date()
+        while position < len(counts) and counts[position][0] <= day:
+            _, status, count = counts[position]
+            totals[status] += count
+            position += 1
+        stats.append(
+            AttendingStats(
+                date,
+                totals["Accepted"],
+                totals["Declined"],
+                totals["Pending"],
+                sum(totals.values()),
+            )
+        )
+    return stats
 
 
 def prepare_plot_data(attending_stats):
@@ -178,6 +296,11 @@ def prepare_plot_data(attending_stats):
     # https://plotly.com/python-api-reference/generated/plotly.graph_objects.Bar.html
     # https://plotly.com/python/bar-charts/#bar-chart-with-relative-barmode
 
+    # Plotly takes a long time to import and only the home page uses it, so it's
+    # imported here rather than by every worker as it starts
+    from plotly.offline import plot
+    import plotly.graph_objs as graph_objs
+
     figure = graph_objs.Figure(
         layout_title_text="Guests",
     )
@@ -225,15 +348,46 @@ class HomePage(LoginRequiredMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        dates = get_all_dates()
 
-        # Load named tuple into each date
-        attending_stats = [load_attending_stats(date) for date in dates]
-        # Put all logic into prepare_plot_data function
-        context["plot_div"] = prepare_plot_data(attending_stats)
+        def plot_div():
+            dates = get_all_dates()
+            # Nobody has been invited yet, so there's nothing to chart
+            if not dates:
+                return ""
+            # Load named tuple into each date
+            attending_stats = load_attending_stats(dates)
+            # Put all logic into prepare_plot_data function
+            return prepare_plot_data(attending_stats)
+
+        # The template caches the chart until a guest changes, and only calls
+        # plot_div() to draw it again when it isn't cached
+        context["plot_div"] = plot_div
+        context["guest_data_version"] = caching.get_guest_data_version()
+        context["summary"] = counters.summary()
+        context["chart_cache_seconds"] = settings.CHART_CACHE_SECONDS
         return context
 
 
+def event_stream_response(stream):
+    """Wrap a stream of server-sent events, or tell the browser to stop reconnecting
+    (with a 204) if live updates are turned off"""
+    if not settings.RSVP_EVENTS_STREAM_SECONDS:
+        return HttpResponse(status=204)
+    response = StreamingHttpResponse(stream, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Stop nginx from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@login_required
+def rsvp_events(request):
+    """Streams RSVP changes to the home page chart and the guest list"""
+    return event_stream_response(
+        events.stream_events(request.headers.get("Last-Event-ID"))
+    )
+
+
 class EmailList(LoginRequiredMixin, CreateView):
     model = Email
     form_class = NewEmailForm
@@ -242,9 +396,9 @@ class EmailList(LoginRequiredMixin, CreateView):
     # Retrieve list of emails
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["emails"] = Email.objects.filter(date_sent__isnull=False)
-        for email in context["emails"]:
-            email.count = email.guest.all().count()
+        context["emails"] = Email.objects.filter(date_sent__isnull=False).annotate(
+            recipient_count=Count("guest")
+        )
         return context
 
     # Override get_success_url method to use the newly-created object's PK
@@ -267,6 +421,9 @@ def generate_message(self, **kwargs):
     main = kwargs.get("main", "")
     dietaries = kwargs.get("dietaries", [])
     if re.search("{{ rsvp_qr_code }}", merged_message):
+        from qr_code.qrcode.maker import QRCodeOptions
+        from qr_code.qrcode.serve import make_qr_code_url
+
         qr_options = QRCodeOptions(image_format="png", size="s")
         qr_url = make_qr_code_url(rsvp_url, qr_options)
         qr_url = self.request.build_absolute_uri(qr_url)
@@ -317,10 +474,16 @@ class EmailConfirm(LoginRequiredMixin, UpdateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["uncontactable_guests"] = False
-        for guest in self.get_object().audience.guest.all():
-            if guest.email_address == "":
-                context["uncontactable_guests"] = True
+        members = self.object.audience.members().select_related("title", "rsvp_status")
+        context.update(
+            members.aggregate(
+                recipient_count=Count("pk", filter=~Q(email_address="")),
+                uncontactable_count=Count("pk", filter=Q(email_address="")),
+            )
+        )
+        context["recipients"] = members.exclude(email_address="")
+        if context["uncontactable_count"]:
+            context["uncontactable_guests"] = members.filter(email_address="")
         return context
 
     def post(self, request, *args, **kwargs):
@@ -331,32 +494,47 @@ class EmailConfirm(LoginRequiredMixin, UpdateView):
         self.object = self.get_object()
         self.object.date_sent = datetime.now()
         self.object.save()
-        for guest in self.object.audience.guest.all():
-            if guest.email_address == "":
-                continue
-            guest.emails.add(self.object)
-            first_name = guest.first_name
-            rsvp_link = guest.rsvp_link
-            rsvp_url = self.request.build_absolute_uri(
-                reverse("rsvp", args=[rsvp_link])
-            )
-            rsvp_url_html = "<a href='" + rsvp_url + "'>" + rsvp_url + "</a>"
-            merged_message, rendered_message = generate_message(
-                self, 
-                first_name=first_name, 
-                rsvp_url=rsvp_url, 
-                rsvp_url_html=rsvp_url_html
-            )
+        # Guests who have already been sent it are skipped, so sending again after a
+        # failure carries on where it stopped. They're sent in order so that everyone
+        # sent it so far can be recorded with one statement.
+        recipients = (
+            self.object.audience.members()
+            .exclude(email_address="")
+            .exclude(emails=self.object)
+            .order_by("pk")
+        )
+        sent_up_to = None
+        try:
+            for guest in recipients:
+                first_name = guest.first_name
+                rsvp_link = guest.rsvp_link
+                rsvp_url = self.request.build_absolute_uri(
+                    reverse("rsvp", args=[rsvp_link])
+                )
+                rsvp_url_html = "<a href='" + rsvp_url + "'>" + rsvp_url + "</a>"
+                merged_message, rendered_message = generate_message(
+                    self, 
+                    first_name=first_name, 
+                    rsvp_url=rsvp_url, 
+                    rsvp_url_html=rsvp_url_html
+                )
 
-            # https://docs.djangoproject.com/en/4.2/topics/email/
-            send_mail(
-                self.object.subject,
-                message=merged_message,
-                from_email=settings.FROM_EMAIL,
-                recipient_list=[guest.email_address],
-                fail_silently=False,
-                html_message=rendered_message,
-            )
+                # https://docs.djangoproject.com/en/4.2/topics/email/
+                with metrics.track_email_send():
+                    send_mail(
+                        self.object.subject,
+                        message=merged_message,
+                        from_email=settings.FROM_EMAIL,
+                        recipient_list=[guest.email_address],
+                        fail_silently=False,
+                        html_message=rendered_message,
+                    )
+                sent_up_to = guest.pk
+        finally:
+            # Only the guests it was actually sent to are recorded, even if the mail
+            # server fails partway through
+            if sent_up_to is not None:
+                recipients.filter(pk__lte=sent_up_to).mark_sent(self.object)
 
         return HttpResponseRedirect(self.get_success_url())
 
@@ -365,6 +543,14 @@ class EmailDetail(LoginRequiredMixin, DetailView):
     model = Email
     template_name = "weddingwrangle/email_detail.html"
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # The guests it was sent to, rather than the audience's members now
+        context["recipients"] = self.object.guest.select_related(
+            "title", "rsvp_status"
+        )
+        return context
+
 
 class RSVPEmailTemplate(LoginRequiredMixin, UpdateView):
     model = Email
@@ -372,10 +558,9 @@ class RSVPEmailTemplate(LoginRequiredMixin, UpdateView):
     template_name = "weddingwrangle/email_rsvp_template.html"
 
 
-    # Overriding get_object so that the RSVP link captured by the URL dispatcher is used
-    # to find the object. self.kwargs is a dictionary containing captured URL parameters.
+    # Overriding get_object so that the RSVP template is found by its stable key
     def get_object(self):
-        return self.model.objects.get(subject="Thank you for RSVPing!")
+        return self.model.objects.get(key=Email.RSVP_TEMPLATE_KEY)
 
 class GuestUpload(LoginRequiredMixin, View):
     template_name = "weddingwrangle/guest_upload.html"
@@ -423,8 +608,10 @@ def export_csv(response):
             "Dietaries",
         ]
     )
-    for guest in Guest.objects.all():
+    for guest in Guest.objects.with_related():
         rsvp_at = ""
+        partner_first = ""
+        partner_surname = ""
         if guest.partner != None:
             partner_first = guest.partner.first_name
             partner_surname = guest.partner.surname
@@ -448,6 +635,7 @@ def export_csv(response):
                 dietaries,
             ]
         )
+        metrics.CSV_ROWS.labels(direction="export").inc()
 
     return response
 
@@ -455,6 +643,7 @@ def export_csv(response):
 @login_required
 def export_qr(request):
     """Exports QR codes in a zip file; each QR code is named after the appropriate guest"""
+    from qr_code.qrcode.maker import QRCodeOptions, make_qr_code_image
 
     folder = "weddingwrangle/qr_codes/"
     zip_filename = "weddingwrangle_qr_code_export"
@@ -484,8 +673,10 @@ def export_qr(request):
         protocol = "https" if request.is_secure() else "http"
         path = reverse("rsvp", args=[guest.rsvp_link])
         rsvp_url = f"{protocol}://{current_site}{path}"
+        with metrics.QR_CODE_SECONDS.time():
+            image = make_qr_code_image(rsvp_url, qr_options)
         file = open(filename, "wb")
-        file.write(make_qr_code_image(rsvp_url, qr_options))
+        file.write(image)
         file.close()
 
     shutil.make_archive(zip_filename, "zip", folder)